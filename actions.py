@@ -3,11 +3,12 @@ from __future__ import annotations
 from typing import Optional, Tuple, TYPE_CHECKING
 
 import color
+from entity import Item
 import exceptions
 
 if TYPE_CHECKING:
     from engine import Engine
-    from entity import Actor, Entity, Item
+    from entity import Actor, Entity
 
 
 class Action:
@@ -39,12 +40,12 @@ class PickupAction(Action):
         actor_location_y = self.entity.y
         inventory = self.entity.inventory
 
-        for item in self.engine.game_map.items:
-            if actor_location_x == item.x and actor_location_y == item.y:
+        for item in self.engine.game_map.get_entities_at_location(actor_location_x, actor_location_y):
+            if isinstance(item, Item):
                 if len(inventory.items) >= inventory.capacity:
                     raise exceptions.Impossible("Your inventory is full. ")
 
-                self.engine.game_map.entities.remove(item)
+                self.engine.game_map.remove_entity(item)
                 item.parent = self.entity.inventory
                 inventory.items.append(item)
 
@@ -96,12 +97,17 @@ class WaitAction(Action):
         pass
 
 class TakeStairsAction(Action):
-    # Take the stairs, if any exist at the entity's location
+    # Take the stairs, up or down, if any exist at the entity's location
     def perform(self) -> None:
-        if(self.entity.x, self.entity.y) == self.engine.game_map.downstairs_location:
-            self.engine.game_world.generate_floor()
+        location = (self.entity.x, self.entity.y)
+        if location == self.engine.game_map.downstairs_location:
+            self.engine.game_world.descend()
             self.engine.message_log.add_message("You descend the staircase.", 
                                                 color.descend)
+        elif location == self.engine.game_map.upstairs_location:
+            self.engine.game_world.ascend()
+            self.engine.message_log.add_message("You ascend the staircase.", 
+                                                color.ascend)
         else: 
             raise exceptions.Impossible("There are no stairs here.")
 
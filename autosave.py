@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import time
+import traceback
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+import save_codecs
+import savefile
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from journal import Journal
+
+
+class Autosaver:
+    """ Saves the game every 'interval' turns and whenever the floor changes,
+    without stalling the main loop.
+    The main thread only takes a snapshot (the uncompressed save sections),
+    then compression and the atomic write happen on a worker thread. At most
+    one save is in flight; if the previous one is still being written, the
+    snapshot is retried on the next check.
+    With a 'journal', each snapshot is also checkpointed in the journal and
+    the records before it are dropped once the save is written, and a new or
+    loaded game is saved straight away so its journal has a snapshot to be
+    replayed from.
+    """
+    def __init__(self, filename: str, interval: int = 50, codec: str = "zlib:1",
+                 journal: Optional[Journal] = None):
+        self.filename = filename
+        self.interval = interval
+        self.journal = journal
+        # Autosaves are frequent, so by default they trade size for speed
+        self.codec = save_codecs.get_codec(codec)
+        # Seconds spent on the main thread taking each snapshot, and on the
+        # worker compressing and writing each save
+        self.snapshot_times: List[float] = []
+        self.save_times: List[float] = []
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Autosaver")
+        self._pending: Optional[Future] = None
+        self._pending_snapshot_id: Optional[str] = None
+        self._engine: Optional[Engine] = None
+        self._saved_turn = 0
+        self._saved_floor = 0
+
+    @property
+    def busy(self) -> bool:
+        return self._pending is not None and not self._pending.done()
+
+    # Return True if the engine has changed enough since the last save
+    def is_due(self, engine: Engine) -> bool:
+        if engine is not self._engine:
+            # A new or loaded game, count from where it is now
+            self._engine = engine
+            self._saved_turn = engine.turn_count
+            self._saved_floor = engine.game_world.current_floor
+            if self.journal is None:
+                return False
+            # Save straight away, the journal needs a snapshot to replay from
+            engine.journal = self.journal
+            self._saved_turn -= self.interval
+        return (engine.game_world.current_floor != self._saved_floor
+                or engine.turn_count - self._saved_turn >= self.interval)
+
+    # Call after every turn. Starts a background save if one is due. Returns
+    # True if a save was started.
+    def update(self, engine: Engine) -> bool:
+        self._check_finished()
+        if not engine.player.is_alive:
+            # The save is about to be deleted, don't race to write it back
+            self.wait()
+            return False
+        if not self.is_due(engine) or self.busy:
+            return False
+
+        start = time.perf_counter()
+        header, sections = savefile.engine_sections(engine)
+        self.snapshot_times.append(time.perf_counter() - start)
+        if self.journal is not None:
+            self.journal.checkpoint(engine, header["snapshot_id"])
+            self._pending_snapshot_id = header["snapshot_id"]
+
+        self._saved_turn = engine.turn_count
+        self._saved_floor = engine.game_world.current_floor
+        self._pending = self._executor.submit(self._write, header, sections)
+        return True
+
+    def _write(self, header: Dict[str, Any], sections: List[savefile.Section]) -> None:
+        start = time.perf_counter()
+        savefile.write_save(self.filename, header, sections, self.codec)
+        self.save_times.append(time.perf_counter() - start)
+
+    # Report a background save which failed, or drop the journal records a
+    # finished one has made unneeded, on the journal's worker
+    def _check_finished(self) -> None:
+        if self._pending is not None and self._pending.done():
+            error = self._pending.exception()
+            self._pending = None
+            if error is not None:
+                traceback.print_exception(type(error), error, error.__traceback__)
+            elif self.journal is not None:
+                self.journal.compact(self._pending_snapshot_id)
+
+    # Block until any background save is finished
+    def wait(self) -> None:
+        if self._pending is not None:
+            self._pending.exception()
+            self._check_finished()
+
+    def shutdown(self) -> None:
+        self.wait()
+        self._executor.shutdown()
+        if self.journal is not None:
+            self.journal.close()
+
+    def report(self) -> str:
+        lines = [f"autosaves: {len(self.save_times)}"]
+        for name, times in (("snapshot", self.snapshot_times), ("save", self.save_times)):
+            if times:
+                lines.append(f"  {name:<8} mean {sum(times) / len(times) * 1000:7.2f} ms  "
+                             f"max {max(times) * 1000:7.2f} ms")
+        return "\n".join(lines)
@@ -0,0 +1,74 @@
+""" Measure how many floors per second the dungeon generator makes.
+
+Run from the repository root:
+    python -m benchmarks.dungeon_generation --floors 500 --map-size 80x43
+
+Floors 1 to --floors of one seed are generated with procgen.generate_dungeon,
+the same as GameWorld.generate_floor but without any background work, and
+the best of --repeat runs is reported. The checksum covers the tiles and
+entity positions of every floor, so it only changes if the floors do.
+--tables FILE generates with the spawn tables in a JSON file instead of
+spawn_tables.json, see dungeon_stats.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import List, Optional, Tuple
+import zlib
+
+import dungeon_stats
+import procgen
+import setup_game
+
+
+def map_size(text: str) -> Tuple[int, int]:
+    width, _, height = text.partition("x")
+    return int(width), int(height)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--floors", type=int, default=500)
+    parser.add_argument("--map-size", type=map_size, default=(80, 43), help="WIDTHxHEIGHT")
+    parser.add_argument("--max-rooms", type=int, default=None,
+                        help="rooms tried per floor, by default scaled with the map area")
+    parser.add_argument("--repeat", type=int, default=3, help="take the best of this many runs")
+    parser.add_argument("--tables", metavar="FILE", default=None, help="JSON file of spawn tables to use")
+    args = parser.parse_args(argv)
+    if args.tables:
+        with open(args.tables) as f:
+            dungeon_stats.apply_tables(json.load(f))
+    width, height = args.map_size
+
+    engine = setup_game.new_game(seed=args.seed)
+    game_world = engine.game_world
+    # Keep about the same room density as the default floors
+    max_rooms = args.max_rooms or max(1, game_world.max_rooms * width * height // (80 * 43))
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        checksum = 0
+        start = time.perf_counter()
+        for floor in range(1, args.floors + 1):
+            game_world.current_floor = floor
+            dungeon = procgen.generate_dungeon(max_rooms = max_rooms,
+                                               room_min_size = game_world.room_min_size,
+                                               room_max_size = game_world.room_max_size,
+                                               map_width = width,
+                                               map_height = height,
+                                               engine = engine)
+            checksum = zlib.crc32(dungeon.tiles.tobytes(), checksum)
+            positions = sorted((entity.name, entity.x, entity.y) for entity in dungeon.entities)
+            checksum = zlib.crc32(repr(positions).encode(), checksum)
+        best = min(best, time.perf_counter() - start)
+
+    print(f"{args.floors} floors of {width}x{height}, {max_rooms} rooms tried per floor")
+    print(f"{args.floors / best:.1f} floors/s, {best / args.floors * 1000:.3f} ms/floor")
+    print(f"checksum {checksum:08x}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+""" Measure how many entities per second can be copied from their prototypes.
+
+Run from the repository root:
+    python -m benchmarks.entity_spawning --count 20000
+
+Every prototype in entity_factories is copied --count times with
+copy.deepcopy, as Entity.spawn used to, and with prototypes.clone, which it
+uses now, and the best of --repeat runs of each is reported. The last column
+is the time taken by Entity.spawn as a whole, which also adds the copy to a
+map.
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import time
+from typing import Callable, List, Optional
+
+from engine import Engine
+from entity import Entity
+import entity_factories
+from game_map import GameMap
+import prototypes
+
+
+def best_rate(count: int, repeat: int, run: Callable[[], None]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=20000, help="copies made of each prototype per run")
+    parser.add_argument("--repeat", type=int, default=3, help="take the best of this many runs")
+    args = parser.parse_args(argv)
+    count = args.count
+
+    engine = Engine(player=prototypes.clone(entity_factories.player), seed=1)
+    names = [name for name, value in vars(entity_factories).items() if isinstance(value, Entity)]
+
+    print(f"{'prototype':<18} {'deepcopy/s':>12} {'clone/s':>12} {'speedup':>8} {'spawn/s':>12}")
+    for name in names:
+        prototype = getattr(entity_factories, name)
+
+        def deepcopies() -> None:
+            for _ in range(count):
+                copy.deepcopy(prototype)
+
+        def clones() -> None:
+            for _ in range(count):
+                prototypes.clone(prototype)
+
+        def spawns() -> None:
+            game_map = GameMap(engine, 80, 43)
+            for i in range(count):
+                prototype.spawn(game_map, i % 80, i // 80 % 43)
+
+        deepcopy_rate = best_rate(count, args.repeat, deepcopies)
+        clone_rate = best_rate(count, args.repeat, clones)
+        spawn_rate = best_rate(count, args.repeat, spawns)
+        print(f"{name:<18} {deepcopy_rate:12.0f} {clone_rate:12.0f} "
+              f"{clone_rate / deepcopy_rate:7.1f}x {spawn_rate:12.0f}")
+
+
+if __name__ == "__main__":
+    main()
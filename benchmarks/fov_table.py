@@ -0,0 +1,124 @@
+""" Compare precomputed VisibilityTable lookups against live compute_fov.
+
+Run from the repository root:
+    python -m benchmarks.fov_table --seed 1 --turns 3000 --map-size 300
+
+The per-tile comparison is made on a floor of --map-size tiles square, where
+the cost of a full-map compute_fov grows with the map but a lookup does not.
+The per-turn comparison plays the default 80x43 floors, waiting for each
+floor's table to finish building before playing on it.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import List, Optional, TYPE_CHECKING
+
+import numpy as np
+from tcod.map import compute_fov
+
+from fov import VisibilityTable
+import headless
+import setup_game
+
+if TYPE_CHECKING:
+    from actions import Action
+    from engine import Engine
+
+
+def per_tile_comparison(seed: int, map_size: int, samples: int) -> None:
+    random.seed(seed)
+    engine = setup_game.new_game()
+    game_world = engine.game_world
+    game_world.map_width = game_world.map_height = map_size
+    # Keep about the same room density as the default floors
+    game_world.max_rooms = game_world.max_rooms * map_size * map_size // (80 * 43)
+    game_world.generate_floor()
+    game_map = engine.game_map
+    transparent = game_map.tiles["transparent"]
+
+    start = time.perf_counter()
+    table = VisibilityTable(
+        transparent,
+        game_map.tiles["walkable"],
+        radius=engine.fov_radius,
+        algorithm=engine.fov_algorithm,
+        tiles_version=game_map.tiles_version,
+    ).build()
+    build_time = time.perf_counter() - start
+
+    walkable = list(zip(*np.nonzero(game_map.tiles["walkable"])))
+    points = random.sample(walkable, min(samples, len(walkable)))
+
+    start = time.perf_counter()
+    for x, y in points:
+        compute_fov(transparent, (x, y), radius=engine.fov_radius, algorithm=engine.fov_algorithm)
+    live_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for x, y in points:
+        table.lookup(x, y)
+    lookup_time = time.perf_counter() - start
+
+    mismatches = sum(
+        not np.array_equal(
+            table.lookup(x, y),
+            compute_fov(transparent, (x, y), radius=engine.fov_radius, algorithm=engine.fov_algorithm),
+        )
+        for x, y in points
+    )
+
+    print(f"map {game_map.width}x{game_map.height}, {len(walkable)} walkable tiles, {len(points)} sampled")
+    print(f"table build: {build_time * 1000:.1f} ms, {table.nbytes / 1024:.1f} KiB")
+    print(f"compute_fov: {live_time / len(points) * 1e6:.1f} us per call")
+    print(f"lookup:      {lookup_time / len(points) * 1e6:.1f} us per call")
+    print(f"mismatches:  {mismatches}")
+
+
+# Wait for each new floor's table to finish building before playing on it,
+# which is what happens when a person reads the screen after taking the stairs
+def wait_for_tables(bot: headless.Bot) -> headless.Bot:
+    maps_seen = set()
+
+    def waiting_bot(engine: Engine) -> Action:
+        if engine.game_map not in maps_seen:
+            maps_seen.add(engine.game_map)
+            if engine.game_map.visibility_table is not None:
+                engine.game_map.visibility_table.wait()
+        return bot(engine)
+    return waiting_bot
+
+
+# FOV caching is turned off so every turn pays for a lookup or a shadowcast
+def turn_comparison(seed: int, turns: int) -> None:
+    for precompute in (False, True):
+        result = headless.run(
+            turns,
+            wait_for_tables(headless.descend_bot(random.Random(seed))),
+            seed=seed,
+            precompute_visibility=precompute,
+            fov_cache_size=0,
+        )
+        update_fov = result.phases.totals["update_fov"] / result.phases.calls["update_fov"]
+        label = "precomputed" if precompute else "live"
+        print(f"{label:<12} handle_action mean "
+              f"{result.phases.totals['handle_action'] / result.phases.calls['handle_action'] * 1e6:6.1f} us  "
+              f"update_fov mean {update_fov * 1e6:6.1f} us")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--turns", type=int, default=3000)
+    parser.add_argument("--map-size", type=int, default=200)
+    parser.add_argument("--samples", type=int, default=2000, help="tiles sampled for the per-tile comparison")
+    args = parser.parse_args(argv)
+
+    per_tile_comparison(args.seed, args.map_size, args.samples)
+    print()
+    turn_comparison(args.seed, args.turns)
+
+
+if __name__ == "__main__":
+    main()
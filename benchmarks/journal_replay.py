@@ -0,0 +1,107 @@
+""" Measure how fast the action journal records and replays turns.
+
+Run from the repository root:
+    python -m benchmarks.journal_replay --turns 5000
+
+A bot plays --turns turns from a snapshot with the journal attached, with the
+player made too tough to die so the session lasts. The snapshot is then loaded
+and the journal replayed on it, the way a crash is recovered from. Replay
+speed is reported in turns per second next to the speed of live play, and the
+replayed game is checked against the one that was played.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import headless
+import input_handlers
+import journal
+import savefile
+import setup_game
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+
+# Enough to survive any number of turns
+PLAYER_HP = 10 ** 6
+
+
+# What has to match between the played and the replayed game
+def game_state(engine: Engine) -> Tuple:
+    game_map = engine.game_map
+    player = engine.player
+    return (
+        engine.turn_count,
+        engine.game_world.current_floor,
+        player.x, player.y, player.fighter.hp, player.level.current_xp,
+        game_map.tiles.tobytes(), game_map.explored.tobytes(),
+        sorted((entity.name, entity.x, entity.y) for entity in game_map.entities),
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=32, help="journal records written per batch")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        save_filename = os.path.join(directory, "snapshot.sav")
+        journal_filename = os.path.join(directory, "snapshot.sav.journal")
+
+        random.seed(args.seed)
+        engine = setup_game.new_game()
+        engine.player.fighter.max_hp = engine.player.fighter.hp = PLAYER_HP
+        header, sections = savefile.engine_sections(engine)
+        savefile.write_save(save_filename, header, sections, "zlib:1")
+
+        engine.journal = journal.Journal(journal_filename, batch_size=args.batch_size)
+        engine.journal.checkpoint(engine, header["snapshot_id"])
+        record_action = engine.journal.record_action
+        append_time = 0.0
+
+        # Time only the journal's share of each turn
+        def timed_record_action(engine: Engine, action) -> None:
+            nonlocal append_time
+            start = time.perf_counter()
+            record_action(engine, action)
+            append_time += time.perf_counter() - start
+
+        engine.journal.record_action = timed_record_action
+
+        handler = input_handlers.EventHandler(engine)
+        bot = headless.descend_bot(random.Random(args.seed))
+        start = time.perf_counter()
+        for _ in range(args.turns):
+            handler.handle_action(bot(engine))
+            if engine.player.level.requires_level_up:
+                engine.journal.record_level_up(engine, 0)
+                engine.player.level.increase_max_hp()
+        play_time = time.perf_counter() - start
+        engine.journal.close()
+        played_state = game_state(engine)
+        journal_size = os.path.getsize(journal_filename)
+
+        replayed = savefile.load(save_filename)
+        start = time.perf_counter()
+        records = journal.records_after(journal_filename, header["snapshot_id"])
+        played = journal.replay(replayed, records)
+        replay_time = time.perf_counter() - start
+
+    print(f"{args.turns} turns to floor {engine.game_world.current_floor}, "
+          f"{engine.journal.records} records, {journal_size / 1024:.1f} KiB, {engine.journal.syncs} fsyncs")
+    print(f"play    {args.turns / play_time:9.0f} turns/s")
+    print(f"replay  {played / replay_time:9.0f} turns/s  ({played} of {len(records) - 1} records)")
+    print(f"append  {append_time / args.turns * 1e6:9.2f} us/turn")
+    print("replayed game matches" if game_state(replayed) == played_state else "REPLAYED GAME DIFFERS")
+
+
+if __name__ == "__main__":
+    main()
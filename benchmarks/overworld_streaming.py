@@ -0,0 +1,82 @@
+""" Measure the cost of streaming the overworld's chunks as the player walks.
+
+Run from the repository root:
+    python -m benchmarks.overworld_streaming --steps 5000 --store-bytes 262144
+
+The player starts a new game in the overworld and walks --steps steps east,
+sidestepping rocks, through Engine.update_fov and a rendered frame per step
+like the main loop, with monsters kept from killing them. Reported are the
+steps per second, how often the window moved and what that cost, and the
+memory held by the map and its ChunkStore at the end, which stays about the
+same however far the walk goes. Chunks beyond --store-bytes are spilled to
+files.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import List, Optional
+
+import tcod
+
+from actions import BumpAction
+import headless
+import input_handlers
+from overworld import OverworldMap
+import setup_game
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--store-bytes", type=int, default=None,
+                        help="memory bound of the ChunkStore, by default its own")
+    args = parser.parse_args(argv)
+
+    engine = setup_game.new_game(seed=args.seed, overworld=True, pregenerate_floors=False)
+    game_map = engine.game_map
+    assert isinstance(game_map, OverworldMap)
+    if args.store_bytes is not None:
+        game_map.chunks.max_bytes = args.store_bytes
+
+    # Time each move of the window
+    shifts: List[float] = []
+    shift_window = game_map.shift_window
+
+    def timed_shift_window(dx: int, dy: int) -> None:
+        start = time.perf_counter()
+        shift_window(dx, dy)
+        shifts.append(time.perf_counter() - start)
+    game_map.shift_window = timed_shift_window  # type: ignore[assignment]
+
+    console = tcod.console.Console(headless.SCREEN_WIDTH, headless.SCREEN_HEIGHT, order="F")
+    handler = input_handlers.EventHandler(engine)
+    rng = random.Random(args.seed)
+    walkable = game_map.tiles["walkable"]
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        engine.player.fighter.hp = engine.player.fighter.max_hp
+        player = engine.player
+        dx, dy = 1, rng.choice((-1, 0, 1))
+        if not walkable[player.x + dx, player.y + dy]:
+            dx, dy = rng.choice(headless.DIRECTIONS)
+        handler.handle_action(BumpAction(player, dx, dy))
+        console.clear()
+        engine.render(console)
+    elapsed = time.perf_counter() - start
+
+    x, y = game_map.window_to_world(engine.player.x, engine.player.y)
+    print(f"{args.steps} steps in {elapsed:.2f} s, {args.steps / elapsed:.0f} steps/s, ended at ({x}, {y})")
+    if shifts:
+        print(f"window moved {len(shifts)} times, mean {sum(shifts) / len(shifts) * 1000:.3f} ms, "
+              f"max {max(shifts) * 1000:.3f} ms")
+    print(f"chunks generated {game_map.chunks_generated}, loaded {game_map.chunks_loaded}, "
+          f"evicted {game_map.chunks_evicted}, stored {len(game_map.chunks)}, spilled {game_map.chunks.spills}")
+    print(f"map {game_map.nbytes - game_map.chunks.nbytes} bytes, chunks in memory {game_map.chunks.nbytes} bytes, "
+          f"{len(game_map.entities)} entities in the window")
+
+
+if __name__ == "__main__":
+    main()
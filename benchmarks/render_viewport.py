@@ -0,0 +1,64 @@
+""" Measure the cost of drawing a frame on maps of different sizes.
+
+Run from the repository root:
+    python -m benchmarks.render_viewport --sizes 80x43 200x200 500x500 1000x1000
+
+For each size a floor is generated with about the default room density, and
+a bot plays --turns turns on it. Each turn one frame is drawn through
+Engine.render, which only composes the part of the map in the camera's view,
+and the mean time per frame is reported. The first frame of each floor is
+timed separately, since it allocates the floor's graphics buffer.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import List, Optional
+
+import tcod
+
+from benchmarks.dungeon_generation import map_size
+import headless
+import input_handlers
+import setup_game
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--turns", type=int, default=300)
+    parser.add_argument("--sizes", type=map_size, nargs="+",
+                        default=[(80, 43), (200, 200), (500, 500), (1000, 1000)], help="WIDTHxHEIGHT")
+    args = parser.parse_args(argv)
+
+    console = tcod.console.Console(headless.SCREEN_WIDTH, headless.SCREEN_HEIGHT, order="F")
+    print(f"{'map':>10} {'first frame ms':>15} {'frame ms':>9}")
+    for width, height in args.sizes:
+        engine = setup_game.new_game(seed=args.seed, pregenerate_floors=False)
+        game_world = engine.game_world
+        game_world.max_rooms = max(1, game_world.max_rooms * width * height // (80 * 43))
+        game_world.map_width, game_world.map_height = width, height
+        game_world.generate_floor()
+        engine.update_fov()
+
+        start = time.perf_counter()
+        engine.render(console)
+        first_frame = time.perf_counter() - start
+
+        handler = input_handlers.EventHandler(engine)
+        bot = headless.random_walk_bot(random.Random(args.seed))
+        total = 0.0
+        for _ in range(args.turns):
+            # Keep the player alive, new floors are the same size
+            engine.player.fighter.hp = engine.player.fighter.max_hp
+            handler.handle_action(bot(engine))
+            console.clear()
+            start = time.perf_counter()
+            engine.render(console)
+            total += time.perf_counter() - start
+        print(f"{width}x{height:<6} {first_frame * 1000:15.3f} {total / args.turns * 1000:9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+""" Compare save compression codecs on a synthetic long-running save.
+
+Run from the repository root:
+    python -m benchmarks.save_codecs --turns 5000 --codecs lzma lzma:0 zlib:1 zlib:6 raw
+
+A bot plays --turns turns with the player healed every turn, so the whole
+session stays in one save with a long message log. The sections of that save
+which are normally compressed are then compressed and decompressed with each
+codec. MB/s is measured against the uncompressed size.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import List, Optional, TYPE_CHECKING
+
+import headless
+import input_handlers
+import save_codecs
+import savefile
+import setup_game
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+
+DEFAULT_CODECS = ["lzma", "lzma:0", "zlib:9", "zlib:6", "zlib:1", "raw"]
+
+
+# Play a game which can't be lost, so the save keeps growing
+def long_running_game(seed: int, turns: int) -> Engine:
+    random.seed(seed)
+    engine = setup_game.new_game()
+    handler = input_handlers.EventHandler(engine)
+    bot = headless.descend_bot(random.Random(seed))
+    for _ in range(turns):
+        engine.player.fighter.hp = engine.player.fighter.max_hp
+        handler.handle_action(bot(engine))
+        if engine.player.level.requires_level_up:
+            engine.player.level.increase_max_hp()
+    return engine
+
+
+# Return the seconds one call of 'function' takes, the best of 'repeat' calls
+def best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3, help="take the best of this many runs")
+    parser.add_argument("--codecs", nargs="+", default=DEFAULT_CODECS, help="codec specs to compare")
+    args = parser.parse_args(argv)
+    codecs = [save_codecs.get_codec(spec) for spec in args.codecs]
+
+    engine = long_running_game(args.seed, args.turns)
+    _, sections = savefile.engine_sections(engine)
+    payloads = [
+        section.payload if isinstance(section.payload, bytes) else section.payload()
+        for section in sections if section.compress
+    ]
+    size = sum(len(payload) for payload in payloads)
+    megabytes = size / 1e6
+    print(f"{args.turns} turns, {len(engine.message_log.messages)} messages, "
+          f"{size / 1024:.1f} KiB to compress in {len(payloads)} sections")
+    print(f"{'codec':<8} {'ratio':>6} {'KiB':>8} {'compress MB/s':>14} {'decompress MB/s':>16}")
+
+    for codec in codecs:
+        compressed = [codec.compress(payload) for payload in payloads]
+        assert [codec.decompress(data) for data in compressed] == payloads
+        compressed_size = sum(len(data) for data in compressed)
+
+        compress_time = best_time(lambda: [codec.compress(payload) for payload in payloads], args.repeat)
+        decompress_time = best_time(lambda: [codec.decompress(data) for data in compressed], args.repeat)
+        print(f"{codec.spec:<8} {size / compressed_size:6.2f} {compressed_size / 1024:8.1f} "
+              f"{megabytes / compress_time:14.1f} {megabytes / decompress_time:16.1f}")
+
+
+if __name__ == "__main__":
+    main()
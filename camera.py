@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+
+# The part of the screen above the message log and status bars
+VIEWPORT_WIDTH = 80
+VIEWPORT_HEIGHT = 43
+
+
+class Camera:
+    """ The window of the map shown on screen, 'width' by 'height' tiles
+    starting from the console's top left corner.
+    'x' and 'y' are the map coordinates of the top left tile in view. A map
+    smaller than the viewport is drawn from its top left corner, as before
+    there was a camera.
+    """
+    def __init__(self, width: int = VIEWPORT_WIDTH, height: int = VIEWPORT_HEIGHT):
+        self.width = width
+        self.height = height
+        self.x = 0
+        self.y = 0
+
+    # Center the view on a map position, without showing past the map's edges
+    def follow(self, x: int, y: int, map_width: int, map_height: int) -> None:
+        self.x = max(0, min(x - self.width // 2, map_width - self.width))
+        self.y = max(0, min(y - self.height // 2, map_height - self.height))
+
+    # Return the part of a map in view and where it goes on the console, both
+    # as 2d array indices of the same shape
+    def slices(self, map_width: int, map_height: int) -> Tuple[Tuple[slice, slice], Tuple[slice, slice]]:
+        width = max(0, min(self.width, map_width - self.x))
+        height = max(0, min(self.height, map_height - self.y))
+        view = slice(self.x, self.x + width), slice(self.y, self.y + height)
+        screen = slice(0, width), slice(0, height)
+        return view, screen
+
+    # Return True if this map position is in view
+    def in_view(self, x: int, y: int) -> bool:
+        return self.x <= x < self.x + self.width and self.y <= y < self.y + self.height
+
+    # Return the console position of a map position, or None if it's not in view
+    def map_to_screen(self, x: int, y: int) -> Optional[Tuple[int, int]]:
+        if not self.in_view(x, y):
+            return None
+        return x - self.x, y - self.y
+
+    # Return the map position shown at a console position, or None if the
+    # position is outside the viewport. It may still be outside the map.
+    def screen_to_map(self, x: int, y: int) -> Optional[Tuple[int, int]]:
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        return x + self.x, y + self.y
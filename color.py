@@ -7,6 +7,7 @@ enemy_atk = (0xFF, 0xC0, 0xC0)
 needs_target = (0x3F, 0xFF, 0xFF)
 status_effect_applied = (0x3F, 0xFF, 0x3F)
 descend = (0x9F, 0x3F, 0xFF)
+ascend = (0x9F, 0x3F, 0xFF)
 
 player_die = (0xFF, 0x30, 0x30)
 enemy_die = (0xFF, 0xA0, 0x30)
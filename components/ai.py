@@ -1,12 +1,11 @@
 from __future__ import annotations
 
-import random
 from typing import List, Optional, Tuple, TYPE_CHECKING
 
-import numpy as np  # For type: ignore
 import tcod
 
 from actions import Action, BumpAction, MeleeAction, MovementAction, WaitAction
+from engine import UNREACHABLE
 
 if TYPE_CHECKING:
     from entity import Actor
@@ -17,17 +16,7 @@ class BaseAI(Action):
 
     # Compute and return a path to the destination.
     def get_path_to(self, dest_x: int, dest_y: int) -> List[Tuple[int, int]]:
-        # Copy the walkable array
-        cost = np.array(self.entity.gamemap.tiles["walkable"], dtype=np.int8)
-
-        for entity in self.entity.gamemap.entities:
-            # Check if an entity blocks movement and the cose isn't zero
-            if entity.blocks_movement and cost[entity.x, entity.y]:
-                # Add to the cost of a blocked position.
-                # A lower number means more enemies will crowd behind each other in
-                # hallways.  A higher number means enemies will take longer paths in
-                # order to surround the player.
-                cost[entity.x, entity.y] += 10
+        cost = self.entity.gamemap.get_movement_cost()
 
         # Create a graph from the cost array and pass the graph to a new pathfinder
         graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
@@ -41,6 +30,20 @@ class BaseAI(Action):
         # Convert from List[List[int]] to list[Tuple[int, int]]
         return [(index[0], index[1]) for index in path]
 
+    # Return a path to the player by walking down the engine's shared distance
+    # map, instead of running a new pathfinder for this actor.
+    def get_path_to_player(self) -> List[Tuple[int, int]]:
+        distance = self.engine.get_player_distance_map()
+
+        # Unreachable from here, there is no gradient to follow
+        if distance[self.entity.x, self.entity.y] == UNREACHABLE:
+            return []
+
+        path: List[List[int]] = tcod.path.hillclimb2d(
+            distance, (self.entity.x, self.entity.y), cardinal=True, diagonal=True,
+        )[1:].tolist()
+        return [(index[0], index[1]) for index in path]
+
 # A confused enemy will stumble around aimlessly for a given number of turns, 
 # then revert back to its previous AI. If an actor occupies a tile it is 
 # randomly moving into, it will attact. 
@@ -60,14 +63,14 @@ class ConfusedEnemy(BaseAI):
             self.entity.ai = self.previous_ai
         else:  
             # Pick a random direction
-            direction_x, direction_y = random.choice([(-1, -1), # Northwest
-                                                     (0, -1), # North
-                                                     (1, -1), # Northeast
-                                                     (-1, 0), # West
-                                                     (1, 0), # East
-                                                     (-1, 1), # Southwest
-                                                     (0, 1), # South
-                                                     (1, 1)])# Southeast
+            direction_x, direction_y = self.engine.rng.ai.choice([(-1, -1), # Northwest
+                                                                  (0, -1), # North
+                                                                  (1, -1), # Northeast
+                                                                  (-1, 0), # West
+                                                                  (1, 0), # East
+                                                                  (-1, 1), # Southwest
+                                                                  (0, 1), # South
+                                                                  (1, 1)])# Southeast
             
             self.turns_remaining -= 1
 
@@ -97,7 +100,7 @@ class HostileEnemy(BaseAI):
         if self.engine.game_map.visible[self.entity.x, self.entity.y]:
             if distance <= 1:
                 return MeleeAction(self.entity, dx, dy).perform()
-            self.path = self.get_path_to(target.x, target.y)
+            self.path = self.get_path_to_player()
 
         if self.path:
             dest_x, dest_y = self.path.pop(0)
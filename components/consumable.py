@@ -104,16 +104,14 @@ class FireballDamageConsumable(Consumable):
         if not self.engine.game_map.visible[target_xy]:
             raise Impossible("You cannot target an area that you cannot see.")
 
-        targets_hit = False
-        for actor in self.engine.game_map.actors:
-            if actor.distance(*target_xy) <= self.radius:
-                self.engine.message_log.add_message(
-                    f"The {actor.name} is engulfed in a fiery explosion, taking {self.damage} damage!"
-                )
-                actor.fighter.take_damage(self.damage)
-                targets_hit = True
+        targets = self.engine.game_map.get_actors_within_radius(*target_xy, self.radius)
+        for actor in targets:
+            self.engine.message_log.add_message(
+                f"The {actor.name} is engulfed in a fiery explosion, taking {self.damage} damage!"
+            )
+            actor.fighter.take_damage(self.damage)
         
-        if not targets_hit:
+        if not targets:
             raise Impossible("There are no targets in the radius.")
         self.consume()
         
@@ -124,16 +122,9 @@ class LightningDamageConsumable(Consumable):
 
     def activate(self, action: actions.ItemAction) -> None:
         consumer = action.entity
-        target = None
-        closest_distance = self.maximum_range + 1.0
-
-        for actor in self.engine.game_map.actors:
-            if actor is not consumer and self.parent.gamemap.visible[actor.x, actor.y]:
-                distance = consumer.distance(actor.x, actor.y)
-            
-                if distance < closest_distance:
-                    target = actor
-                    closest_distance = distance
+        target = self.engine.game_map.get_closest_visible_actor(
+            consumer.x, consumer.y, self.maximum_range, exclude = consumer,
+        )
 
         if target:
             self.engine.message_log.add_message(
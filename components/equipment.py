@@ -56,6 +56,7 @@ class Equipment(BaseComponent):
             self.unequip_from_slot(slot, add_message)
 
         setattr(self, slot, item)
+        self.parent.refresh()
 
         if add_message:
             self.equip_message(item.name)
@@ -67,6 +68,7 @@ class Equipment(BaseComponent):
             self.unequip_message(current_item.name)
         
         setattr(self, slot, None)
+        self.parent.refresh()
 
     def toggle_equip(self, equippable_item: Item, add_message: bool = True) -> None:
         if (equippable_item.equippable and
@@ -30,6 +30,8 @@ class Fighter(BaseComponent):
         self._hp = max(0, min(value, self.max_hp))
         if self._hp == 0 and self.parent.ai:
             self.die()
+        else:
+            self.parent.refresh()
 
     @property
     def defense(self) -> int: 
@@ -67,6 +69,7 @@ class Fighter(BaseComponent):
         self.parent.ai = None
         self.parent.name = f"remains of {self.parent.name}"
         self.parent.render_order = RenderOrder.CORPSE
+        self.gamemap.refresh_entity(self.parent)
 
         self.engine.message_log.add_message(death_message, death_message_color)
 
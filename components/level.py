@@ -56,11 +56,13 @@ class Level(BaseComponent):
     
     def increase_power(self, amount: int = 1) -> None:
         self.parent.fighter.base_power += amount
+        self.parent.refresh()
         self.engine.message_log.add_message("You feel stronger!")
         self.increase_level()
     
     def increase_defense(self, amount: int = 1) -> None:
         self.parent.fighter.base_defense += amount
+        self.parent.refresh()
         self.engine.message_log.add_message("Your movements are getting swifter!")
         self.increase_level()
 
@@ -0,0 +1,208 @@
+""" Generate many dungeon floors in parallel and report statistics about them,
+for tuning the generator settings and spawn tables.
+
+Example:
+    python dungeon_stats.py --seeds 1000 --floors 10 --format csv > stats.csv
+
+Every floor from 1 to --floors of every seed from 1 to --seeds is generated
+with procgen.generate_dungeon across a pool of worker processes, with no
+window or tcod context. Each worker returns only the numbers measured from its
+floors, so the work scales with the number of processes. By default the rows
+are averaged per floor number; --raw gives one row per (seed, floor).
+
+Measured for each floor:
+    rooms           rooms placed
+    floor_ratio     fraction of the map that can be walked on
+    corridor_tiles  walkable tiles outside of every room
+    stair_distance  steps from the entrance to the stairs down, empty if
+                    they can't be reached
+    <entity name>   how many of each monster and item were spawned
+
+--tables FILE replaces procgen's spawn tables with the ones in a JSON file in
+the same form as spawn_tables.json, holding any of the tables in it, for
+example:
+    {"max_monsters_by_floor": [[1, 3], [4, 4]],
+     "enemy_chances": {"0": [["orc", 70]], "2": [["troll", 20]]}}
+"""
+from __future__ import annotations
+
+import argparse
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import tcod.path
+
+from engine import Engine
+import entity_factories
+import procgen
+import prototypes
+from spawn_tables import SpawnTables
+
+
+# The settings of setup_game.new_game
+MAP_WIDTH = 80
+MAP_HEIGHT = 43
+MAX_ROOMS = 30
+ROOM_MIN_SIZE = 6
+ROOM_MAX_SIZE = 10
+
+METRICS = ("rooms", "floor_ratio", "corridor_tiles", "stair_distance")
+
+Row = Dict[str, Any]
+
+
+# Return the column name for an entity, such as "health_potion"
+def entity_column(name: str) -> str:
+    return name.lower().replace(" ", "_")
+
+
+# Replace procgen's spawn tables with the ones given, in JSON form
+def apply_tables(tables: Dict[str, Any]) -> None:
+    if tables:
+        procgen.spawn_tables = SpawnTables.from_json(tables, defaults=procgen.spawn_tables)
+
+
+# Return the walking distance in steps between two points, or None
+def walking_distance(walkable: np.ndarray, start: Tuple[int, int], end: Tuple[int, int]) -> Optional[int]:
+    distance = tcod.path.maxarray(walkable.shape, dtype=np.int32, order="F")
+    distance[start] = 0
+    tcod.path.dijkstra2d(distance, walkable.astype(np.int8), cardinal=1, diagonal=1, out=distance)
+    steps = int(distance[end])
+    return None if steps == np.iinfo(np.int32).max else steps
+
+
+# Generate floors 1 to 'floors' of one seed and measure each. Runs in the
+# worker processes.
+def seed_stats(seed: int, floors: int, settings: Dict[str, int]) -> List[Row]:
+    engine = Engine(player=prototypes.clone(entity_factories.player), seed=seed)
+    rows = []
+    for floor in range(1, floors + 1):
+        game_map = procgen.generate_dungeon(engine=engine, floor=floor, place_player=False, **settings)
+        walkable = game_map.tiles["walkable"]
+        in_rooms = np.zeros_like(walkable)
+        for room in game_map.rooms:
+            in_rooms[room.inner] = True
+
+        row: Row = {
+            "seed": seed,
+            "floor": floor,
+            "rooms": len(game_map.rooms),
+            "floor_ratio": float(walkable.mean()),
+            "corridor_tiles": int(np.count_nonzero(walkable & ~in_rooms)),
+            "stair_distance": walking_distance(walkable, game_map.entrance, game_map.downstairs_location),
+        }
+        row.update(Counter(entity_column(entity.name) for entity in game_map.entities))
+        rows.append(row)
+    return rows
+
+
+# Average the rows of each floor number. Entities missing from a row count as
+# none, and floors with unreachable stairs are left out of stair_distance.
+def aggregate(rows: List[Row]) -> List[Row]:
+    by_floor: Dict[int, List[Row]] = defaultdict(list)
+    for row in rows:
+        by_floor[row["floor"]].append(row)
+    entities = sorted({key for row in rows for key in row} - {"seed", "floor"} - set(METRICS))
+
+    summary = []
+    for floor, floor_rows in sorted(by_floor.items()):
+        result: Row = {"floor": floor, "samples": len(floor_rows)}
+        for column in METRICS + tuple(entities):
+            values = [row.get(column, 0) for row in floor_rows]
+            if column == "stair_distance":
+                reachable = [value for value in values if value is not None]
+                result["stair_distance"] = round(sum(reachable) / len(reachable), 3) if reachable else None
+                result["stair_distance_max"] = max(reachable, default=None)
+                result["unreachable_stairs"] = len(values) - len(reachable)
+            else:
+                result[column] = round(sum(values) / len(values), 3)
+        summary.append(result)
+    return summary
+
+
+def write_rows(rows: List[Row], output_format: str, output) -> None:
+    if output_format == "json":
+        json.dump(rows, output, indent=1)
+        output.write("\n")
+        return
+    columns: List[str] = []
+    for row in rows:
+        columns.extend(key for key in row if key not in columns)
+    writer = csv.DictWriter(output, fieldnames=columns, restval=0, lineterminator="\n")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({key: "" if value is None else value for key, value in row.items()})
+
+
+def run(seeds: List[int],
+        floors: int,
+        settings: Dict[str, int],
+        *,
+        workers: Optional[int] = None,
+        tables: Optional[Dict[str, Any]] = None) -> List[Row]:
+    """ Return the rows of every floor of every seed, in seed order.
+    'settings' are passed to generate_dungeon and 'tables' to apply_tables in
+    each worker.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=apply_tables, initargs=(tables or {},)) as executor:
+        # A few seeds per task keeps the overhead down without starving workers
+        chunksize = max(1, len(seeds) // ((workers or os.cpu_count() or 1) * 8))
+        results = executor.map(seed_stats, seeds, [floors] * len(seeds), [settings] * len(seeds),
+                               chunksize=chunksize)
+        return [row for rows in results for row in rows]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seeds", type=int, default=1000, help="number of seeds")
+    parser.add_argument("--first-seed", type=int, default=1)
+    parser.add_argument("--floors", type=int, default=10, help="floors generated per seed")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, by default one per core")
+    parser.add_argument("--map-width", type=int, default=MAP_WIDTH)
+    parser.add_argument("--map-height", type=int, default=MAP_HEIGHT)
+    parser.add_argument("--max-rooms", type=int, default=MAX_ROOMS)
+    parser.add_argument("--room-min-size", type=int, default=ROOM_MIN_SIZE)
+    parser.add_argument("--room-max-size", type=int, default=ROOM_MAX_SIZE)
+    parser.add_argument("--tables", metavar="FILE", default=None, help="JSON file of spawn tables to use")
+    parser.add_argument("--raw", action="store_true", help="one row per floor generated instead of averages")
+    parser.add_argument("--format", choices=["csv", "json"], default="csv")
+    parser.add_argument("--output", "-o", default=None, help="write here instead of to stdout")
+    args = parser.parse_args(argv)
+
+    settings = {
+        "map_width": args.map_width,
+        "map_height": args.map_height,
+        "max_rooms": args.max_rooms,
+        "room_min_size": args.room_min_size,
+        "room_max_size": args.room_max_size,
+    }
+    tables = None
+    if args.tables:
+        with open(args.tables) as f:
+            tables = json.load(f)
+    seeds = list(range(args.first_seed, args.first_seed + args.seeds))
+
+    start = time.perf_counter()
+    rows = run(seeds, args.floors, settings, workers=args.workers, tables=tables)
+    elapsed = time.perf_counter() - start
+    print(f"{len(rows)} floors in {elapsed:.2f} s, {len(rows) / elapsed:.0f} floors/s "
+          f"with {args.workers or os.cpu_count()} worker(s)", file=sys.stderr)
+
+    if not args.raw:
+        rows = aggregate(rows)
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            write_rows(rows, args.format, f)
+    else:
+        write_rows(rows, args.format, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,114 @@
 from __future__ import annotations
 
-import lzma
-import pickle 
-from typing import TYPE_CHECKING
+from typing import Optional, TYPE_CHECKING
 
+import numpy as np
+import tcod.constants
 from tcod.console import Console
 from tcod.map import compute_fov
+import tcod.path
 
+from camera import Camera
+from entity_store import ACTOR, ALIVE
 import exceptions
 from message_log import MessageLog
 import render_functions
+from rng import RandomStreams
 
 if TYPE_CHECKING:
     from entity import Actor
     from game_map import GameMap, GameWorld
+    from journal import Journal
+
+# Distance map value for tiles which can't reach the player
+UNREACHABLE = np.iinfo(np.int32).max
 
 
 class Engine:
     game_map: GameMap
     game_world: GameWorld
 
-    def __init__(self, player: Actor):
+    fov_radius = 8
+    fov_algorithm = tcod.constants.FOV_RESTRICTIVE
+
+    # Where player input is recorded, if anywhere. Set by the main loop.
+    journal: Optional[Journal] = None
+
+    def __init__(self, player: Actor, seed: Optional[int] = None):
+        # Every random number in the game comes from these, see rng
+        self.rng = RandomStreams(seed)
         self.message_log = MessageLog()
+        # The part of the map on screen, and the map position under the mouse
+        self.camera = Camera()
         self.mouse_location = (0, 0)
         self.player = player
+        # Number of turns the player has taken in this game
+        self.turn_count = 0
+        self.player_distance_map: Optional[np.ndarray] = None
     
     def handle_enemy_turns(self) -> None:
-        for entity in set(self.game_map.actors) - {self.player}:
-            if entity.ai:
+        # Monsters share one distance map per turn, built on first use
+        self.player_distance_map = None
+        # In entity store order rather than set order, so turns are taken in
+        # the same order every time a game is played back
+        store = self.game_map.entity_store
+        for entity in store.select(store.has_flags(ACTOR | ALIVE)):
+            if entity is not self.player and entity.ai:
                 try: 
                     entity.ai.perform()
                 except exceptions.Impossible:
                     pass # Ignore impossible action exceptions from AI
+        self.player_distance_map = None
+
+    # Return the walking distance from every tile to the player, computed once
+    # per enemy turn with the same costs as BaseAI.get_path_to, within the
+    # map's pathfinding area
+    def get_player_distance_map(self) -> np.ndarray:
+        if self.player_distance_map is None:
+            distance = tcod.path.maxarray(
+                (self.game_map.width, self.game_map.height), dtype=np.int32, order="F"
+            )
+            distance[self.player.x, self.player.y] = 0
+            area = self.game_map.pathfinding_area(self.player.x, self.player.y)
+            tcod.path.dijkstra2d(
+                distance[area], self.game_map.get_movement_cost()[area], cardinal=2, diagonal=3, out=distance[area]
+            )
+            self.player_distance_map = distance
+        return self.player_distance_map
     
-    # Recompute the visible area based on the player's point of view
+    # Recompute the visible area based on the player's point of view. Results
+    # are cached per map, so turns where neither the player nor the map's
+    # tiles changed skip the FOV computation. A finished VisibilityTable for
+    # the map is used before falling back to compute_fov. Maps streamed
+    # around the player first get to move, see GameMap.stream_around.
     def update_fov(self) -> None:
-        self.game_map.visible[:] = compute_fov(
-            self.game_map.tiles["transparent"], 
-            (self.player.x, self.player.y), 
-            radius = 8,
-        )
+        self.game_map.stream_around(self.player.x, self.player.y)
+        key = (self.player.x, self.player.y, self.fov_radius, self.fov_algorithm,
+               self.game_map.tiles_version)
+        visible = self.game_map.fov_cache.get(key)
+
+        table = self.game_map.visibility_table
+        if visible is None and table is not None and table.matches(*key[2:]):
+            visible = table.lookup(self.player.x, self.player.y)
+            if visible is not None:
+                self.game_map.fov_cache.put(key, visible)
+
+        if visible is None:
+            visible = compute_fov(
+                self.game_map.tiles["transparent"], 
+                (self.player.x, self.player.y), 
+                radius = self.fov_radius,
+                algorithm = self.fov_algorithm,
+            )
+            self.game_map.fov_cache.put(key, visible)
+
+        self.game_map.visible[:] = visible
         # If a game tile is visible, add it to "explored" array
         self.game_map.explored |= self.game_map.visible
     
     def render(self, console: Console) -> None:
-        self.game_map.render(console)
+        self.camera.follow(self.player.x, self.player.y, self.game_map.width, self.game_map.height)
+        self.game_map.render(console, self.camera)
 
         self.message_log.render(console=console, x=21, y=45, width=40, height=5)
 
@@ -62,11 +126,12 @@ class Engine:
                                                         y = 44, 
                                                         engine = self)
 
-    # Save this Engine instance as a compressed file
-    def save_as(self, filename: str) -> None:
-        save_data = lzma.compress(pickle.dumps(self))
-        with open(filename, "wb") as f:
-            f.write(save_data)
+    # Save this Engine instance to a file, see savefile for the format and
+    # save_codecs for the codecs
+    def save_as(self, filename: str, codec: str = "lzma") -> None:
+        import savefile
+
+        savefile.save_engine(self, filename, codec)
 
 
 
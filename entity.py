@@ -1,9 +1,9 @@
 from __future__ import annotations
 
-import copy
 import math
 from typing import Optional, Tuple, TypeVar, TYPE_CHECKING, Union
 
+import prototypes
 from render_order import RenderOrder
 
 if TYPE_CHECKING:
@@ -41,33 +41,43 @@ class Entity:
         self.render_order = render_order
         # If parent isn't provided now, it will be set later
         if parent:
-            self.gamemap = parent
-            parent.entities.add(self)
+            self.parent = parent
+            parent.add_entity(self)
         
     @property
     def gamemap(self) -> GameMap:
         return self.parent.gamemap
 
 
-    # Spawn a copy of this instance at the given location
+    # Spawn a copy of this instance at the given location, see prototypes
     def spawn(self: T, gamemap: GameMap, x: int, y: int) -> T:
-        clone = copy.deepcopy(self)
+        clone = prototypes.clone(self)
         clone.x = x
         clone.y = y 
         clone.parent = gamemap
-        gamemap.entities.add(clone)
+        gamemap.add_entity(clone)
         return clone
     
     # Place this entity at a new location. Handles moving across GameMaps
     def place(self, x: int, y: int, gamemap: Optional[GameMap] = None) -> None:
-        self.x = x
-        self.y = y
         if gamemap:
             if hasattr(self, "parent"): # If uninitialized
                 if self.parent is self.gamemap:
-                    self.gamemap.entities.remove(self)
+                    self.gamemap.remove_entity(self)
+            self.x = x
+            self.y = y
             self.parent = gamemap
-            gamemap.entities.add(self)
+            gamemap.add_entity(self)
+        else:
+            self.x = x
+            self.y = y
+            if self.parent is self.gamemap:
+                self.gamemap.refresh_entity(self)
+
+    # Let the GameMap holding this entity know that its state changed
+    def refresh(self) -> None:
+        if self.parent is self.gamemap:
+            self.gamemap.refresh_entity(self)
 
     # Return the distance between the current entity and the given coords
     def distance(self, x: int, y: int) -> float:
@@ -78,6 +88,7 @@ class Entity:
         # Move the entity by the input amount
         self.x += dx
         self.y += dy
+        self.gamemap.refresh_entity(self)
 
 class Actor(Entity):
     def __init__(
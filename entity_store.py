@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+import numpy as np
+
+from entity import Actor, Item
+
+if TYPE_CHECKING:
+    from entity import Entity
+
+
+# Bits of EntityStore.flags
+BLOCKS = 1
+ACTOR = 2
+ITEM = 4
+ALIVE = 8
+
+
+class EntityStore:
+    """ Struct-of-arrays copy of the entities on a GameMap.
+    Each entity owns one row, and its position, fighter stats, render order,
+    glyph and flags are kept in contiguous NumPy columns so queries over many entities
+    can be answered with array masks instead of Python loops. The Entity
+    objects stay the source of truth: GameMap writes their state through to
+    the store whenever they change.
+    """
+    def __init__(self, capacity: int = 64):
+        self.in_use = np.zeros(capacity, dtype=bool)
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.hp = np.zeros(capacity, dtype=np.int32)
+        self.max_hp = np.zeros(capacity, dtype=np.int32)
+        self.power = np.zeros(capacity, dtype=np.int32)
+        self.defense = np.zeros(capacity, dtype=np.int32)
+        self.render_order = np.zeros(capacity, dtype=np.int8)
+        self.flags = np.zeros(capacity, dtype=np.uint8)
+        # Glyph and foreground color, for drawing
+        self.ch = np.zeros(capacity, dtype=np.int32)
+        self.fg = np.zeros((capacity, 3), dtype=np.uint8)
+
+        self.objects: List[Optional[Entity]] = [None] * capacity
+        self.rows: Dict[Entity, int] = {}
+        self._free_rows: List[int] = list(range(capacity - 1, -1, -1))
+
+    COLUMNS = ("in_use", "x", "y", "hp", "max_hp", "power", "defense", "render_order", "flags", "ch", "fg")
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.objects)
+
+    # Double the size of every column
+    def _grow(self) -> None:
+        old_capacity = self.capacity
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros((old_capacity * 2,) + column.shape[1:], dtype=column.dtype)
+            grown[:old_capacity] = column
+            setattr(self, name, grown)
+        self.objects.extend([None] * old_capacity)
+        self._free_rows.extend(range(old_capacity * 2 - 1, old_capacity - 1, -1))
+
+    # Give an entity a row, or the given free row, and fill it in
+    def add(self, entity: Entity, row: Optional[int] = None) -> int:
+        if entity in self.rows:
+            return self.update(entity)
+        if row is None:
+            if not self._free_rows:
+                self._grow()
+            row = self._free_rows.pop()
+        else:
+            while row >= self.capacity:
+                self._grow()
+            self._free_rows.remove(row)
+        self.rows[entity] = row
+        self.objects[row] = entity
+        self.in_use[row] = True
+        return self.update(entity)
+
+    # Free the row owned by an entity
+    def remove(self, entity: Entity) -> None:
+        row = self.rows.pop(entity)
+        self.objects[row] = None
+        self.in_use[row] = False
+        self.flags[row] = 0
+        self._free_rows.append(row)
+
+    # Copy the current state of an entity into its row
+    def update(self, entity: Entity) -> int:
+        row = self.rows[entity]
+        self.x[row] = entity.x
+        self.y[row] = entity.y
+        self.render_order[row] = entity.render_order.value
+        self.ch[row] = ord(entity.char)
+        self.fg[row] = entity.color
+
+        flags = BLOCKS if entity.blocks_movement else 0
+        if isinstance(entity, Actor):
+            flags |= ACTOR
+            if entity.is_alive:
+                flags |= ALIVE
+            fighter = entity.fighter
+            self.hp[row] = fighter.hp
+            self.max_hp[row] = fighter.max_hp
+            self.power[row] = fighter.power
+            self.defense[row] = fighter.defense
+        elif isinstance(entity, Item):
+            flags |= ITEM
+        self.flags[row] = flags
+        return row
+
+    # Return the entities owning the rows selected by a boolean mask
+    def select(self, mask: np.ndarray) -> List[Entity]:
+        return [self.objects[row] for row in np.flatnonzero(mask)]
+
+    # Mask of the rows with all of the given flags set
+    def has_flags(self, flags: int) -> np.ndarray:
+        return self.in_use & ((self.flags & flags) == flags)
+
+    # Mask of the rows standing on a True tile of a (width, height) array,
+    # such as GameMap.visible
+    def on_tiles(self, tiles: np.ndarray) -> np.ndarray:
+        return self.in_use & tiles[self.x, self.y]
+
+    # Mask of the rows within Euclidean distance 'radius' of (x, y)
+    def within_radius(self, x: int, y: int, radius: float) -> np.ndarray:
+        dx = self.x - x
+        dy = self.y - y
+        return self.in_use & (dx * dx + dy * dy <= radius * radius)
+
+    # Return the living actors within 'radius' of (x, y)
+    def living_actors_within(self, x: int, y: int, radius: float) -> List[Actor]:
+        return self.select(self.has_flags(ACTOR | ALIVE) & self.within_radius(x, y, radius))
+
+    # Return the rows standing on a True tile of 'tiles' that should be drawn:
+    # one per tile, the one with the highest render order
+    def drawable_rows(self, tiles: np.ndarray) -> np.ndarray:
+        rows = np.flatnonzero(self.on_tiles(tiles))
+        # Reverse sorted order, so that the first row found for each tile is
+        # the one drawn last
+        rows = rows[np.argsort(self.render_order[rows], kind="stable")][::-1]
+        tile_index = self.x[rows].astype(np.int64) * tiles.shape[1] + self.y[rows]
+        _, first = np.unique(tile_index, return_index=True)
+        return rows[first]
+
+    # Return the entities standing on a True tile of 'tiles'
+    def entities_on_tiles(self, tiles: np.ndarray) -> List[Entity]:
+        return self.select(self.on_tiles(tiles))
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import threading
+from typing import Dict, Optional, TYPE_CHECKING
+
+from spill_store import Payload, SpillStore
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from game_map import GameMap
+
+
+class _FloorSnapshot:
+    """ Serializes a floor held in memory for a save, once, on whichever
+    thread asks first: normally the autosave worker, or the main thread if
+    the player returns to the floor before the save is written.
+    """
+    def __init__(self, game_map: GameMap, codec: str):
+        self._game_map: Optional[GameMap] = game_map
+        self._codec = codec
+        self._data: Optional[bytes] = None
+        self._lock = threading.Lock()
+
+    def __call__(self) -> bytes:
+        import savefile
+
+        with self._lock:
+            if self._data is None:
+                self._data = savefile.encode_floor(self._game_map, self._codec)
+                self._game_map = None
+            return self._data
+
+
+class FloorCache(SpillStore[int, "GameMap"]):
+    """ Keeps the floors the player isn't on, so they can be revisited.
+    Recently left floors stay in memory as long as their estimated size
+    (GameMap.nbytes) fits in 'max_bytes', older floors are serialized with
+    'codec' and spilled to disk, see SpillStore. The floor the player is on is
+    never in the cache, and nothing changes a floor while it is stored, so
+    each floor is serialized at most once per visit and the result is reused
+    by every save.
+    """
+    prefix = "floors-"
+    _transient = SpillStore._transient + ("_serialized", "_snapshots")
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024, codec: str = "zlib:1"):
+        self.codec = codec
+        # Floors found in memory and floors read back from disk
+        self.hits = 0
+        self.misses = 0
+        super().__init__(max_bytes)
+
+    def _reset(self) -> None:
+        super()._reset()
+        # Serialized copies of floors in memory, made when first needed
+        self._serialized: Dict[int, bytes] = {}
+        # Floors in memory which a save will serialize, see _payload
+        self._snapshots: Dict[int, _FloorSnapshot] = {}
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _value_nbytes(self, floor: int) -> int:
+        return self._in_memory[floor].nbytes + len(self._serialized.get(floor, b""))
+
+    def serialize(self, floor: int) -> bytes:
+        import savefile
+
+        data = self._serialized.get(floor)
+        if data is None:
+            snapshot = self._snapshots.pop(floor, None)
+            if snapshot is not None:
+                data = snapshot()
+            else:
+                data = savefile.encode_floor(self._in_memory[floor], self.codec)
+            self._serialized[floor] = data
+        return data
+
+    def _forget(self, floor: int) -> None:
+        self._serialized.pop(floor, None)
+        self._snapshots.pop(floor, None)
+
+    # Floors not serialized yet are serialized by the save's writer
+    def _payload(self, floor: int) -> Payload:
+        data = self._serialized.get(floor)
+        if data is not None:
+            return data
+        snapshot = self._snapshots.get(floor)
+        if snapshot is None:
+            snapshot = self._snapshots[floor] = _FloorSnapshot(self._in_memory[floor], self.codec)
+        return snapshot
+
+    # Remove a floor from the cache and return it, loading it from disk if it
+    # was spilled. Returns None if the floor was never stored.
+    def take(self, floor: int, engine: Engine) -> Optional[GameMap]:
+        import savefile
+
+        # A save waiting for this floor needs it as it is now, before the
+        # player changes it
+        snapshot = self._snapshots.get(floor)
+        if snapshot is not None:
+            snapshot()
+        game_map = self.pop(floor)
+        if game_map is not None:
+            self.hits += 1
+            return game_map
+        data = self.pop_spilled(floor)
+        if data is None:
+            return None
+        self.misses += 1
+        return savefile.decode_floor(data, engine)
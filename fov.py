@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+from tcod.map import compute_fov
+
+
+class FovCache:
+    """ Remembers recent field of view results.
+    Keys should contain everything the result depends on: the point of view,
+    radius, algorithm and the map's tiles_version. The least recently used
+    result is dropped once 'max_entries' are stored.
+    """
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, np.ndarray] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    # Return the cached result for this key, or None
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        visible = self._entries.get(key)
+        if visible is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return visible
+
+    def put(self, key: Hashable, visible: np.ndarray) -> None:
+        self._entries[key] = visible
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    # Cached results are cheap to recompute, so they are not saved
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_entries"] = OrderedDict()
+        return state
+
+
+class VisibilityTable:
+    """ Precomputed field of view for every walkable tile of a static map.
+    For each walkable tile the tiles visible from it within 'radius' are stored
+    as a bit-packed (2 * radius + 1) square window, so a lookup is an unpack
+    instead of a shadowcast. Only valid while the map's tiles_version matches
+    the version the table was built from.
+    """
+    def __init__(self, transparent: np.ndarray, walkable: np.ndarray,
+                 radius: int, algorithm: int, tiles_version: int):
+        self.width, self.height = transparent.shape
+        self.radius = radius
+        self.algorithm = algorithm
+        self.tiles_version = tiles_version
+        self.ready = False
+
+        self._transparent = np.array(transparent, dtype=bool, order="F")
+        self._walkable = np.array(walkable, dtype=bool, order="F")
+        # Index into _packed for each tile, or -1 for tiles with no entry
+        self._rows = np.full((self.width, self.height), -1, dtype=np.int32, order="F")
+        self._packed = np.zeros((0, 0), dtype=np.uint8)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def side(self) -> int:
+        return 2 * self.radius + 1
+
+    # Number of bytes used by the packed windows
+    @property
+    def nbytes(self) -> int:
+        return self._packed.nbytes + self._rows.nbytes
+
+    # Return the window around (x, y), clipped to the map, as slices of the
+    # map and of the (side, side) window
+    def _window(self, x: int, y: int) -> Tuple[Tuple[slice, slice], Tuple[slice, slice]]:
+        r = self.radius
+        x0, x1 = max(0, x - r), min(self.width, x + r + 1)
+        y0, y1 = max(0, y - r), min(self.height, y + r + 1)
+        map_slices = (slice(x0, x1), slice(y0, y1))
+        window_slices = (slice(x0 - (x - r), x1 - (x - r)), slice(y0 - (y - r), y1 - (y - r)))
+        return map_slices, window_slices
+
+    # Compute every window. FOV within the radius only depends on the tiles
+    # inside the window, so each tile only shadowcasts over its window.
+    def build(self) -> VisibilityTable:
+        xs, ys = np.nonzero(self._walkable)
+        side = self.side
+        packed = np.zeros((len(xs), (side * side + 7) // 8), dtype=np.uint8)
+        window = np.zeros((side, side), dtype=bool)
+
+        for row, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+            map_slices, window_slices = self._window(x, y)
+            window[:] = False
+            window[window_slices] = compute_fov(
+                np.ascontiguousarray(self._transparent[map_slices]),
+                (x - map_slices[0].start, y - map_slices[1].start),
+                radius=self.radius,
+                algorithm=self.algorithm,
+            )
+            packed[row] = np.packbits(window)
+            if self._thread is not None and row % 16 == 15:
+                # Let the main thread have the GIL between batches of tiles
+                time.sleep(0)
+
+        self._rows[xs, ys] = np.arange(len(xs), dtype=np.int32)
+        self._packed = packed
+        # Only needed while building
+        del self._transparent, self._walkable
+        self.ready = True
+        return self
+
+    # Start building on a worker thread. Check 'ready' before using the table.
+    def build_in_background(self) -> VisibilityTable:
+        self._thread = threading.Thread(target=self.build, name="VisibilityTable", daemon=True)
+        self._thread.start()
+        return self
+
+    # Block until a background build is finished
+    def wait(self) -> None:
+        if self._thread is not None:
+            self._thread.join()
+
+    # True if this table can answer a lookup made with these settings
+    def matches(self, radius: int, algorithm: int, tiles_version: int) -> bool:
+        return (self.ready
+                and self.radius == radius
+                and self.algorithm == algorithm
+                and self.tiles_version == tiles_version)
+
+    # Return the visible tiles from (x, y), or None if (x, y) has no entry
+    def lookup(self, x: int, y: int) -> Optional[np.ndarray]:
+        row = self._rows[x, y]
+        if row < 0:
+            return None
+        side = self.side
+        window = np.unpackbits(self._packed[row], count=side * side).view(bool).reshape(side, side)
+        map_slices, window_slices = self._window(x, y)
+        visible = np.zeros((self.width, self.height), dtype=bool, order="F")
+        visible[map_slices] = window[window_slices]
+        return visible
+
+    # Threads can't be saved, so finish any background build first
+    def __getstate__(self) -> Dict[str, Any]:
+        self.wait()
+        state = self.__dict__.copy()
+        state["_thread"] = None
+        return state
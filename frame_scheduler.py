@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from typing import Hashable, Iterable, List, Tuple
+
+import tcod.event
+
+import input_handlers
+
+
+class FrameScheduler:
+    """ Decides when the main loop needs to draw a new frame.
+    A frame is drawn when an event changed what is on screen: the active
+    handler was swapped, a turn advanced, the mouse moved to another tile, or
+    any event other than mouse motion was handled (keys can change UI state
+    such as menus and cursors without swapping handlers).
+    """
+    def __init__(self) -> None:
+        self.needs_redraw = True
+        self.frames_drawn = 0
+        self.frames_skipped = 0
+
+    # Everything about a handler that mouse motion can change on screen
+    @staticmethod
+    def frame_state(handler: input_handlers.BaseEventHandler) -> Tuple[Hashable, ...]:
+        if isinstance(handler, input_handlers.EventHandler):
+            engine = handler.engine
+            return (handler, engine.turn_count, engine.mouse_location)
+        return (handler,)
+
+    # Only the last mouse motion in a batch of events matters, drop the others
+    @staticmethod
+    def coalesce_mouse_motion(events: Iterable[tcod.event.Event]) -> List[tcod.event.Event]:
+        events = list(events)
+        last_motion = None
+        for index, event in enumerate(events):
+            if isinstance(event, tcod.event.MouseMotion):
+                last_motion = index
+        return [
+            event for index, event in enumerate(events)
+            if index == last_motion or not isinstance(event, tcod.event.MouseMotion)
+        ]
+
+    # Record that 'event' was handled, moving from handler 'before' to 'after'
+    def event_handled(self,
+                      event: tcod.event.Event,
+                      before: Tuple[Hashable, ...],
+                      after: input_handlers.BaseEventHandler) -> None:
+        if not isinstance(event, tcod.event.MouseMotion) or self.frame_state(after) != before:
+            self.needs_redraw = True
+
+    # Return True if a frame should be drawn now. Counts skipped frames.
+    def should_draw(self) -> bool:
+        if self.needs_redraw:
+            return True
+        self.frames_skipped += 1
+        return False
+
+    def frame_drawn(self) -> None:
+        self.needs_redraw = False
+        self.frames_drawn += 1
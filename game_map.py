@@ -1,25 +1,74 @@
 from __future__ import annotations
 
-from typing import Iterable, Iterator, Optional, TYPE_CHECKING
+import threading
+import traceback
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
 from unittest.mock import NonCallableMagicMock
 import numpy as np
 from tcod.console import Console
 
+from camera import Camera
 from entity import Actor, Item
+from entity_store import ACTOR, ALIVE, EntityStore
+from floor_cache import FloorCache
+from fov import FovCache, VisibilityTable
 import tile_types
 
 if TYPE_CHECKING:
     from engine import Engine
+    from entity import Entity
+    from procgen import RectangularRoom
+
+# Extra cost of entering a tile with a blocking entity on it.
+# A lower number means more enemies will crowd behind each other in
+# hallways.  A higher number means enemies will take longer paths in
+# order to surround the player.
+BLOCKER_COST = 10
+
+# Rough size of an entity and its components, for GameMap.nbytes
+ENTITY_NBYTES = 2048
 
 class GameMap:
     def __init__(self, engine: Engine, width: int, height: int, entities: Iterable[Entity] = ()):
         self.engine = engine
         self.width, self.height = width, height
-        self.entities = set(entities)
+        self.entities = set()
+        # Spatial index of the entities on this map, by tile. Kept in sync by
+        # add_entity, remove_entity and refresh_entity.
+        self._entities_by_location: Dict[Tuple[int, int], List[Entity]] = {}
+        self._entity_locations: Dict[Entity, Tuple[int, int]] = {}
+        # Where each blocking entity was counted in the movement cost map
+        self._blocker_locations: Dict[Entity, Tuple[int, int]] = {}
+        # Pathfinding costs, built on first use then updated in place
+        self._movement_cost: Optional[np.ndarray] = None
+        # Array-backed copy of the entities on this map, for vectorized queries
+        self.entity_store = EntityStore()
         self.tiles = np.full((width, height), fill_value=tile_types.wall, order="F")
         self.visible = np.full((width, height), fill_value=False, order="F")
         self.explored = np.full((width, height), fill_value=False, order="F")
         self.downstairs_location = (0, 0)
+        # Floors below the first have stairs back up
+        self.upstairs_location: Optional[Tuple[int, int]] = None
+        # Where the player starts on a newly generated floor, and its rooms.
+        # Neither is saved.
+        self.entrance = (0, 0)
+        self.rooms: List[RectangularRoom] = []
+        # Bumped by tiles_changed, so results derived from tile transparency
+        # can tell when they are stale
+        self.tiles_version = 0
+        self.fov_cache = FovCache()
+        # Composed tile graphics, which tiles have been composed, and the
+        # visible/explored state they were composed from, see update_graphics
+        self._graphics: Optional[np.ndarray] = None
+        self._graphics_tiles_version = 0
+        self._composed = np.zeros((width, height), dtype=bool, order="F")
+        self._drawn_visible = np.zeros((width, height), dtype=bool, order="F")
+        self._drawn_explored = np.zeros((width, height), dtype=bool, order="F")
+        # Optional precomputed FOV for every walkable tile, see GameWorld
+        self.visibility_table: Optional[VisibilityTable] = None
+
+        for entity in entities:
+            self.add_entity(entity)
     
     @property
     def gamemap(self) -> GameMap:
@@ -37,57 +86,271 @@ class GameMap:
     @property
     def items(self) -> Iterator[Item]:
         yield from (entity for entity in self.entities if isinstance(entity, Item))
-        
+
+    # Approximate number of bytes used by this map, its caches and entities
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.tiles, self.visible, self.explored,
+                  self._composed, self._drawn_visible, self._drawn_explored]
+        if self._graphics is not None:
+            arrays.append(self._graphics)
+        if self._movement_cost is not None:
+            arrays.append(self._movement_cost)
+        arrays.extend(getattr(self.entity_store, name) for name in EntityStore.COLUMNS)
+        size = sum(array.nbytes for array in arrays)
+        size += len(self.fov_cache) * self.visible.nbytes
+        if self.visibility_table is not None:
+            size += self.visibility_table.nbytes
+        return size + len(self.entities) * ENTITY_NBYTES
+
+    # Add an entity to this map and index it at its current location. 'row'
+    # picks its row in the entity store, see entity_rows.
+    def add_entity(self, entity: Entity, row: Optional[int] = None) -> None:
+        if entity in self.entities:
+            self.refresh_entity(entity)
+            return
+        self.entities.add(entity)
+        self._index(entity)
+        self.entity_store.add(entity, row)
+
+    # Remove an entity from this map and from the spatial index
+    def remove_entity(self, entity: Entity) -> None:
+        self.entities.remove(entity)
+        self._unindex(entity)
+        self.entity_store.remove(entity)
+
+    # Re-index an entity on this map after its location, stats or
+    # blocks_movement changed
+    def refresh_entity(self, entity: Entity) -> None:
+        location = (entity.x, entity.y)
+        if self._entity_locations.get(entity) != location:
+            self._unindex(entity)
+            self._index(entity)
+        elif self._blocker_locations.get(entity) != (location if entity.blocks_movement else None):
+            self._unindex_blocker(entity)
+            self._index_blocker(entity)
+        self.entity_store.update(entity)
+
+    def _index(self, entity: Entity) -> None:
+        location = (entity.x, entity.y)
+        self._entity_locations[entity] = location
+        self._entities_by_location.setdefault(location, []).append(entity)
+        self._index_blocker(entity)
+
+    def _unindex(self, entity: Entity) -> None:
+        self._unindex_blocker(entity)
+        location = self._entity_locations.pop(entity, None)
+        if location is None:
+            return
+        bucket = self._entities_by_location[location]
+        bucket.remove(entity)
+        if not bucket:
+            del self._entities_by_location[location]
+
+    def _index_blocker(self, entity: Entity) -> None:
+        if entity.blocks_movement:
+            location = (entity.x, entity.y)
+            self._blocker_locations[entity] = location
+            self._add_blocker_cost(location, BLOCKER_COST)
+
+    def _unindex_blocker(self, entity: Entity) -> None:
+        location = self._blocker_locations.pop(entity, None)
+        if location is not None:
+            self._add_blocker_cost(location, -BLOCKER_COST)
+
+    def _add_blocker_cost(self, location: Tuple[int, int], amount: int) -> None:
+        # Walls stay at 0 no matter what is standing in them
+        if self._movement_cost is not None and self._movement_cost[location]:
+            self._movement_cost[location] += amount
+
+    # Return every entity on this map with its entity store row, in an order
+    # such that adding them to an empty map with add_entity(entity, row) gives
+    # the same rows and the same order on each tile. Actors take their turns
+    # and items are picked up in those orders, so saves keep them.
+    def entity_rows(self) -> List[Tuple[Entity, int]]:
+        rows = self.entity_store.rows
+        return [
+            (entity, rows[entity])
+            for bucket in self._entities_by_location.values()
+            for entity in bucket
+        ]
+
+    # Return the entities standing on the given tile
+    def get_entities_at_location(self, x: int, y: int) -> List[Entity]:
+        return self._entities_by_location.get((x, y), [])
+
     def get_blocking_entity_at_location(
     self, 
     location_x: int, 
     location_y: int
     ) -> Optional[Entity]:
-        for entity in self.entities:
-            if (entity.blocks_movement 
-               and entity.x == location_x 
-               and entity.y == location_y):
+        for entity in self.get_entities_at_location(location_x, location_y):
+            if entity.blocks_movement:
                 return entity
         
         return None
     
     def get_actor_at_location(self, x:int, y:int) -> Optional[Actor]:
-        for actor in self.actors:
-            if actor.x == x and actor.y == y:
-                return actor 
+        for entity in self.get_entities_at_location(x, y):
+            if isinstance(entity, Actor) and entity.is_alive:
+                return entity
         return None
 
+    # Return the living actors within Euclidean distance 'radius' of (x, y)
+    def get_actors_within_radius(self, x: int, y: int, radius: float) -> List[Actor]:
+        return self.entity_store.living_actors_within(x, y, radius)
+
+    # Return the closest living actor in the FOV that is less than
+    # 'maximum_range' + 1 away from (x, y), ignoring 'exclude'
+    def get_closest_visible_actor(self,
+                                  x: int,
+                                  y: int,
+                                  maximum_range: float,
+                                  exclude: Optional[Entity] = None) -> Optional[Actor]:
+        store = self.entity_store
+        candidates = store.has_flags(ACTOR | ALIVE) & store.on_tiles(self.visible)
+        if exclude in store.rows:
+            candidates[store.rows[exclude]] = False
+
+        rows = np.flatnonzero(candidates)
+        if not rows.size:
+            return None
+
+        squared_distance = (store.x[rows] - x) ** 2 + (store.y[rows] - y) ** 2
+        closest = int(np.argmin(squared_distance))
+        if squared_distance[closest] >= (maximum_range + 1) ** 2:
+            return None
+        return store.objects[rows[closest]]
+
+    # Return the cost of entering each tile, for pathfinding. Walls are 0 and
+    # tiles holding a blocking entity cost extra, so that paths route around
+    # other actors. The array is owned by this map and kept up to date as
+    # entities move, so callers must not modify it.
+    def get_movement_cost(self) -> np.ndarray:
+        if self._movement_cost is None:
+            # Copy the walkable array
+            cost = np.array(self.tiles["walkable"], dtype=np.int8, order="F")
+
+            for x, y in self._blocker_locations.values():
+                if cost[x, y]:
+                    cost[x, y] += BLOCKER_COST
+            self._movement_cost = cost
+        return self._movement_cost
+
+    # Must be called after writing to self.tiles once the map is in use, so
+    # data derived from the tiles is rebuilt
+    def tiles_changed(self) -> None:
+        self._movement_cost = None
+        self.tiles_version += 1
+
+    # Called before each field of view update with the player's position.
+    # Maps holding only the part of the world around the player load and
+    # unload parts of it here, see overworld.
+    def stream_around(self, x: int, y: int) -> None:
+        pass
+
+    # Return the part of the map, as a 2d array index, searched for paths to
+    # the player at (x, y). Tiles outside of it can't reach the player.
+    def pathfinding_area(self, x: int, y: int) -> Tuple[slice, slice]:
+        return slice(None), slice(None)
+
     # Returns True if x and y are inside the bounds of the map
     def in_bounds(self, x: int, y: int) -> bool:
         return 0 <= x < self.width and 0 <= y < self.height
 
-    def render(self, console:Console) -> None:
+    # Return the composed tile graphics of the part of the map in 'view' (a 2d
+    # array index of slices), by default all of it. The buffer is kept between
+    # frames and only the tiles in view which were never composed, or whose
+    # visible or explored state changed since, are composed, so the cost
+    # follows the size of the view rather than the map.
+    def update_graphics(self, view: Tuple[slice, slice] = (slice(None), slice(None))) -> np.ndarray:
+        if self._graphics is None:
+            self._graphics = np.empty(
+                (self.width, self.height), dtype=tile_types.console_graphic_dt, order="F"
+            )
+        if self._graphics_tiles_version != self.tiles_version:
+            self._composed[...] = False
+            self._graphics_tiles_version = self.tiles_version
+
+        # All views of the same part of the map
+        graphics = self._graphics[view]
+        composed = self._composed[view]
+        drawn_visible = self._drawn_visible[view]
+        drawn_explored = self._drawn_explored[view]
+        visible = self.visible[view]
+        explored = self.explored[view]
+
+        stale = ~composed | (visible != drawn_visible) | (explored != drawn_explored)
+        if stale.any():
+            index = np.nonzero(stale)
+            graphics[index] = np.where(
+                visible[index],
+                self.tiles["light"][view][index],
+                np.where(explored[index], self.tiles["dark"][view][index], tile_types.SHROUD),
+            )
+            composed[index] = True
+            drawn_visible[index] = visible[index]
+            drawn_explored[index] = explored[index]
+        return graphics
+
+    def render(self, console: Console, camera: Optional[Camera] = None) -> None:
         # console.tiles_rgb[0:self.width, 0:self.height] = self.tiles["dark"]
         """ Renders the map. 
         If a tile is in the "visible array, then draw it with the "light" colors. 
         If it isn't, but it's in the "explored arraw, then draw it with the "dark" colors. 
         Otherwise, use the SHROUD array. 
+        Only the part of the map in the camera's view is drawn, or all of it
+        from the top left corner if there is no camera.
         """
-        console.tiles_rgb[0:self.width, 0:self.height] = np.select(
-            condlist=[self.visible, self.explored], 
-            choicelist=[self.tiles["light"], self.tiles["dark"]],
-            default=tile_types.SHROUD,
-        )
+        if camera is None:
+            camera = Camera(self.width, self.height)
+        view, screen = camera.slices(self.width, self.height)
+        tiles_rgb = console.tiles_rgb
+        graphics = self.update_graphics(view)
+        target = tiles_rgb[screen]
+        if target.dtype == graphics.dtype:
+            # Same memory layout, so copy whole tiles instead of field by field
+            target.view(f"V{graphics.itemsize}")[...] = graphics.view(f"V{graphics.itemsize}")
+        else:
+            target[...] = graphics
 
-        entities_sorted_for_rendering = sorted(
-            self.entities, key=lambda x: x.render_order.value
-        )
+        # Only draw entities that are in the FOV, the one with the highest
+        # render order on each tile, with a single array write per channel
+        store = self.entity_store
+        rows = store.drawable_rows(self.visible)
+        x, y = store.x[rows] - camera.x, store.y[rows] - camera.y
+        in_view = (x >= 0) & (x < camera.width) & (y >= 0) & (y < camera.height)
+        rows, x, y = rows[in_view], x[in_view], y[in_view]
+        tiles_rgb["ch"][x, y] = store.ch[rows]
+        tiles_rgb["fg"][x, y] = store.fg[rows]
+
+
+# A floor being generated on a worker thread before the player reaches it
+class PregeneratedFloor:
+    def __init__(self, floor: int, generate: Callable[[], GameMap]):
+        self.floor = floor
+        self._game_map: Optional[GameMap] = None
+        self._thread = threading.Thread(target=self._run, args=(generate,), name="PregeneratedFloor", daemon=True)
+        self._thread.start()
+
+    def _run(self, generate: Callable[[], GameMap]) -> None:
+        try:
+            self._game_map = generate()
+        except Exception:
+            traceback.print_exc()
 
-        for entity in entities_sorted_for_rendering:
-            # Only print entities that are in the FOV
-            if self.visible[entity.x, entity.y]:
-                console.print(x=entity.x, 
-                              y=entity.y, 
-                              string=entity.char, 
-                              fg=entity.color)
+    @property
+    def ready(self) -> bool:
+        return not self._thread.is_alive()
+
+    # Wait for the floor and return it, or None if generating it failed
+    def result(self) -> Optional[GameMap]:
+        self._thread.join()
+        return self._game_map
 
 
-# Holds settings for the GameMap, and generates new maps when moving down the stairs
+# Holds settings for the GameMap, generates new maps when moving down the
+# stairs and keeps the floors already visited
 class GameWorld:
     def __init__(self, 
                  *, 
@@ -97,7 +360,11 @@ class GameWorld:
                  max_rooms: int,
                  room_min_size: int, 
                  room_max_size: int, 
-                 current_floor: int = 0):
+                 current_floor: int = 0,
+                 precompute_visibility: bool = False,
+                 pregenerate_floors: bool = True,
+                 overworld: bool = False,
+                 floor_cache_bytes: int = 4 * 1024 * 1024):
         self.engine = engine
 
         self.map_width = map_width
@@ -108,15 +375,135 @@ class GameWorld:
         self.room_max_size = room_max_size
 
         self.current_floor = current_floor
-    
+
+        # Build a VisibilityTable for each new floor on a background thread
+        self.precompute_visibility = precompute_visibility
+
+        # Generate the floor below on a background thread as soon as a floor
+        # is entered, so taking the stairs doesn't have to wait for it
+        self.pregenerate_floors = pregenerate_floors
+        self.pregenerated: Optional[PregeneratedFloor] = None
+        # Floors taken from pregeneration, and how many of those weren't
+        # finished when the player got there
+        self.pregenerated_used = 0
+        self.pregenerated_waits = 0
+
+        # Floor 0 is an open overworld above the dungeon, see overworld
+        self.overworld = overworld
+
+        # Floors the player has left, by number
+        self.floors = FloorCache(max_bytes = floor_cache_bytes)
+
+    # A floor still being generated can't be saved, it's generated again
+    # after loading
+    def __getstate__(self) -> Dict:
+        state = self.__dict__.copy()
+        state["pregenerated"] = None
+        return state
+
+    # Older saves have no floor cache
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.__dict__.setdefault("precompute_visibility", False)
+        self.__dict__.setdefault("floors", FloorCache())
+        self.__dict__.setdefault("pregenerate_floors", True)
+        self.__dict__.setdefault("pregenerated", None)
+        self.__dict__.setdefault("pregenerated_used", 0)
+        self.__dict__.setdefault("pregenerated_waits", 0)
+        self.__dict__.setdefault("overworld", False)
+
+    def descend(self) -> None:
+        self.change_floor(self.current_floor + 1)
+
+    def ascend(self) -> None:
+        self.change_floor(self.current_floor - 1)
+
+    # Move the player to another floor, arriving on the stairs leading back to
+    # the floor they came from. The floor left behind is kept in the cache and
+    # floors never visited are generated.
+    def change_floor(self, floor: int) -> None:
+        engine = self.engine
+        old_floor = self.current_floor
+        old_map: Optional[GameMap] = getattr(engine, "game_map", None)
+
+        self.current_floor = floor
+        game_map = self.floors.take(floor, engine)
+        if game_map is None:
+            self.generate_floor()
+        else:
+            x, y = game_map.upstairs_location if floor > old_floor else game_map.downstairs_location
+            engine.player.place(x, y, game_map)
+            engine.game_map = game_map
+
+        # The player has been moved off the old map, so it can be stored
+        if old_map is not None:
+            self.floors.put(old_floor, old_map)
+        self.precompute_floor(engine.game_map)
+
+    # Set up a new map for the current floor, the one generated ahead of time
+    # if there is one (waiting for it to finish if it must) and otherwise a
+    # freshly generated one
     def generate_floor(self) -> None:
+        game_map = self.take_pregenerated(self.current_floor)
+        if game_map is None:
+            game_map = self.generate_dungeon(self.current_floor)
+        # The player arrives where generate_dungeon would have placed them
+        self.engine.player.place(*game_map.entrance, game_map)
+        self.engine.game_map = game_map
+
+    # Generate the map of a floor, without the player on it
+    def generate_dungeon(self, floor: int) -> GameMap:
         from procgen import generate_dungeon
 
-        self.current_floor += 1
+        if floor == 0 and self.overworld:
+            from overworld import OverworldMap
+
+            overworld = OverworldMap(self.engine)
+            overworld.load_window()
+            return overworld
+
+        return generate_dungeon(max_rooms = self.max_rooms, 
+                                room_min_size = self.room_min_size, 
+                                room_max_size = self.room_max_size, 
+                                map_width = self.map_width, 
+                                map_height = self.map_height,
+                                engine = self.engine,
+                                floor = floor,
+                                top_floor = 0 if self.overworld else 1,
+                                place_player = False)
+
+    # Start generating the floor below on a worker thread, unless it's been
+    # visited or is already being generated
+    def pregenerate_next_floor(self) -> None:
+        floor = self.current_floor + 1
+        if not self.pregenerate_floors or floor in self.floors:
+            return
+        if self.pregenerated is not None and self.pregenerated.floor == floor:
+            return
+        self.pregenerated = PregeneratedFloor(floor, lambda: self.generate_dungeon(floor))
+
+    # Return the map generated ahead of time for a floor, or None if there
+    # isn't one or generating it failed
+    def take_pregenerated(self, floor: int) -> Optional[GameMap]:
+        pregenerated = self.pregenerated
+        if pregenerated is None or pregenerated.floor != floor:
+            return None
+        self.pregenerated = None
+        if not pregenerated.ready:
+            self.pregenerated_waits += 1
+        game_map = pregenerated.result()
+        if game_map is not None:
+            self.pregenerated_used += 1
+        return game_map
 
-        self.engine.game_map = generate_dungeon(max_rooms = self.max_rooms, 
-                                                room_min_size = self.room_min_size, 
-                                                room_max_size = self.room_max_size, 
-                                                map_width = self.map_width, 
-                                                map_height = self.map_height,
-                                                engine = self.engine)
+    # Start any background work for a floor that was just generated or loaded
+    def precompute_floor(self, game_map: GameMap) -> None:
+        if self.precompute_visibility and game_map.visibility_table is None:
+            game_map.visibility_table = VisibilityTable(
+                game_map.tiles["transparent"],
+                game_map.tiles["walkable"],
+                radius = self.engine.fov_radius,
+                algorithm = self.engine.fov_algorithm,
+                tiles_version = game_map.tiles_version,
+            ).build_in_background()
+        self.pregenerate_next_floor()
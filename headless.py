@@ -0,0 +1,356 @@
+""" Run the game without a window, driving it with a scripted or bot action
+stream, and report how fast the simulation runs.
+
+Example:
+    python headless.py --turns 2000 --render --seed 1
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+import tcod
+import tcod.path
+
+from actions import Action, BumpAction, PickupAction, TakeStairsAction, WaitAction
+from autosave import Autosaver
+import input_handlers
+import setup_game
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+
+SCREEN_WIDTH = 80
+SCREEN_HEIGHT = 50
+
+DIRECTIONS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+# A bot looks at the engine and returns the next action the player takes
+Bot = Callable[["Engine"], Action]
+
+
+# Accumulates wall clock time spent in named phases of a turn
+class PhaseTimer:
+    def __init__(self) -> None:
+        self.totals: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.totals[phase] = self.totals.get(phase, 0.0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    # Replace a method on this instance only with one that records its run time
+    def wrap(self, obj: object, method_name: str, phase: Optional[str] = None) -> None:
+        setattr(obj, method_name, TimedMethod(self, getattr(obj, method_name), phase or method_name))
+
+
+# A bound method which adds its run time to a PhaseTimer. Saves of the object
+# (autosaves, for example) store the plain method instead.
+class TimedMethod:
+    def __init__(self, phases: PhaseTimer, method: Callable, phase: str):
+        self.phases = phases
+        self.method = method
+        self.phase = phase
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.method(*args, **kwargs)
+        finally:
+            self.phases.add(self.phase, time.perf_counter() - start)
+
+    def __reduce__(self):
+        return self.method.__reduce__()
+
+
+class HeadlessResult:
+    def __init__(self,
+                 turns: int,
+                 actions_attempted: int,
+                 elapsed: float,
+                 phases: PhaseTimer,
+                 games: int,
+                 fov_cache_hits: int = 0,
+                 fov_cache_misses: int = 0,
+                 autosaver: Optional[Autosaver] = None,
+                 floor_cache_hits: int = 0,
+                 floor_cache_misses: int = 0,
+                 floor_spills: int = 0,
+                 pregenerated_used: int = 0,
+                 pregenerated_waits: int = 0):
+        self.turns = turns
+        self.actions_attempted = actions_attempted
+        self.elapsed = elapsed
+        self.phases = phases
+        self.games = games
+        self.fov_cache_hits = fov_cache_hits
+        self.fov_cache_misses = fov_cache_misses
+        self.autosaver = autosaver
+        self.floor_cache_hits = floor_cache_hits
+        self.floor_cache_misses = floor_cache_misses
+        self.floor_spills = floor_spills
+        self.pregenerated_used = pregenerated_used
+        self.pregenerated_waits = pregenerated_waits
+
+    @property
+    def turns_per_second(self) -> float:
+        return self.turns / self.elapsed if self.elapsed else 0.0
+
+    def report(self) -> str:
+        lines = [
+            f"turns: {self.turns} ({self.actions_attempted} actions attempted, {self.games} game(s))",
+            f"elapsed: {self.elapsed:.3f} s",
+            f"turns/sec: {self.turns_per_second:.1f}",
+        ]
+        fov_lookups = self.fov_cache_hits + self.fov_cache_misses
+        if fov_lookups:
+            lines.append(f"fov cache: {self.fov_cache_hits}/{fov_lookups} hits "
+                         f"({self.fov_cache_hits / fov_lookups:.1%})")
+        floor_lookups = self.floor_cache_hits + self.floor_cache_misses
+        if floor_lookups or self.floor_spills:
+            lines.append(f"floor cache: {self.floor_cache_hits}/{floor_lookups} floors revisited from memory, "
+                         f"{self.floor_spills} spilled to disk")
+        if self.pregenerated_used:
+            lines.append(f"pregenerated floors: {self.pregenerated_used} used, "
+                         f"{self.pregenerated_waits} not ready in time")
+        if self.autosaver is not None:
+            lines.append(self.autosaver.report())
+        for phase, total in sorted(self.phases.totals.items(), key=lambda item: -item[1]):
+            calls = self.phases.calls[phase]
+            lines.append(
+                f"  {phase:<20} total {total * 1000:9.2f} ms  "
+                f"mean {total / calls * 1e6:9.1f} us  calls {calls}"
+            )
+        return "\n".join(lines)
+
+
+# Wander randomly, picking up anything underfoot and taking any stairs found
+def random_walk_bot(rng: random.Random) -> Bot:
+    def bot(engine: Engine) -> Action:
+        player = engine.player
+        if (player.x, player.y) == engine.game_map.downstairs_location:
+            return TakeStairsAction(player)
+        if len(player.inventory.items) < player.inventory.capacity and any(
+            item.x == player.x and item.y == player.y for item in engine.game_map.items
+        ):
+            return PickupAction(player)
+        return BumpAction(player, *rng.choice(DIRECTIONS))
+    return bot
+
+
+# Head for the stairs down, fighting anything adjacent and picking up
+# anything underfoot on the way. On each floor with stairs up, head for those
+# instead with a chance of 'up_chance'.
+def descend_bot(rng: random.Random, up_chance: float = 0.0) -> Bot:
+    wander = random_walk_bot(rng)
+    last_map = None
+    target = (0, 0)
+
+    def bot(engine: Engine) -> Action:
+        nonlocal last_map, target
+        player = engine.player
+        game_map = engine.game_map
+        if game_map is not last_map:
+            last_map = game_map
+            target = game_map.downstairs_location
+            if game_map.upstairs_location and rng.random() < up_chance:
+                target = game_map.upstairs_location
+        if (player.x, player.y) == target:
+            return TakeStairsAction(player)
+        for dx, dy in DIRECTIONS:
+            if game_map.get_actor_at_location(player.x + dx, player.y + dy):
+                return BumpAction(player, dx, dy)
+
+        # Wander now and then so the bot doesn't get stuck behind corpses
+        if rng.random() < 0.1:
+            return wander(engine)
+
+        graph = tcod.path.SimpleGraph(cost=game_map.get_movement_cost(), cardinal=2, diagonal=3)
+        pathfinder = tcod.path.Pathfinder(graph)
+        pathfinder.add_root((player.x, player.y))
+        path = pathfinder.path_to(target)[1:].tolist()
+        if not path:
+            return wander(engine)
+        x, y = path[0]
+        return BumpAction(player, x - player.x, y - player.y)
+    return bot
+
+
+# Go down, but back up a floor often enough to revisit floors
+def stairs_bot(rng: random.Random) -> Bot:
+    return descend_bot(rng, up_chance=0.4)
+
+
+BOTS = {"random": random_walk_bot, "descend": descend_bot, "stairs": stairs_bot}
+
+
+# Play back a fixed sequence of actions built from (dx, dy) steps, where
+# (0, 0) means wait. Waits once the script runs out.
+def scripted_bot(steps: Iterable[Tuple[int, int]]) -> Bot:
+    iterator: Iterator[Tuple[int, int]] = iter(steps)
+
+    def bot(engine: Engine) -> Action:
+        dx, dy = next(iterator, (0, 0))
+        if dx == dy == 0:
+            return WaitAction(engine.player)
+        return BumpAction(engine.player, dx, dy)
+    return bot
+
+
+# Build a new game with the per-phase timers attached
+def new_timed_game(phases: PhaseTimer,
+                   precompute_visibility: bool = False,
+                   floor_cache_bytes: Optional[int] = None,
+                   pregenerate_floors: bool = True,
+                   overworld: bool = False) -> Engine:
+    engine = setup_game.new_game(precompute_visibility=precompute_visibility,
+                                 pregenerate_floors=pregenerate_floors,
+                                 overworld=overworld)
+    if floor_cache_bytes is not None:
+        engine.game_world.floors.max_bytes = floor_cache_bytes
+    phases.wrap(engine, "handle_enemy_turns")
+    phases.wrap(engine, "update_fov")
+    phases.wrap(engine.game_world, "generate_floor")
+    return engine
+
+
+def run(turns: int,
+        bot: Optional[Bot] = None,
+        *,
+        render: bool = False,
+        seed: Optional[int] = None,
+        precompute_visibility: bool = False,
+        fov_cache_size: Optional[int] = None,
+        floor_cache_bytes: Optional[int] = None,
+        pregenerate_floors: bool = True,
+        overworld: bool = False,
+        autosave_to: Optional[str] = None,
+        autosave_interval: int = 50,
+        autosave_codec: str = "zlib:1") -> HeadlessResult:
+    """ Play 'turns' turns of the game with no window attached.
+    Actions are fed through EventHandler.handle_action exactly as the main loop
+    does. If 'render' is True every turn is also drawn to an off-screen console.
+    A new game is started whenever the player dies.
+    'precompute_visibility' builds a VisibilityTable for each floor, and
+    'fov_cache_size' overrides the size of each floor's FovCache (0 disables it)
+    and 'floor_cache_bytes' the memory bound of each game's FloorCache.
+    'pregenerate_floors' generates each next floor on a background thread.
+    'overworld' starts each game in the overworld above the dungeon.
+    If 'autosave_to' is given the game is autosaved there as in the main loop.
+    """
+    if seed is not None:
+        random.seed(seed)
+    if bot is None:
+        bot = random_walk_bot(random.Random(seed))
+
+    phases = PhaseTimer()
+    console = tcod.console.Console(SCREEN_WIDTH, SCREEN_HEIGHT, order="F") if render else None
+
+    autosaver = Autosaver(autosave_to, autosave_interval, autosave_codec) if autosave_to else None
+
+    engine = new_timed_game(phases, precompute_visibility, floor_cache_bytes, pregenerate_floors, overworld)
+    game_worlds = [engine.game_world]
+    # The FOV caches of every map played, which don't keep the maps in memory
+    fov_caches = set()
+    timed_map = None
+    games = 1
+    handler = input_handlers.EventHandler(engine)
+    completed = 0
+    attempted = 0
+
+    start = time.perf_counter()
+    while completed < turns:
+        if engine.game_map.fov_cache not in fov_caches:
+            fov_caches.add(engine.game_map.fov_cache)
+            if fov_cache_size is not None:
+                engine.game_map.fov_cache.max_entries = fov_cache_size
+
+        action = bot(engine)
+        attempted += 1
+
+        action_start = time.perf_counter()
+        advanced = handler.handle_action(action)
+        phases.add("handle_action", time.perf_counter() - action_start)
+
+        if advanced:
+            completed += 1
+            if autosaver is not None:
+                autosave_start = time.perf_counter()
+                autosaver.update(engine)
+                phases.add("autosave", time.perf_counter() - autosave_start)
+
+        if not engine.player.is_alive:
+            engine = new_timed_game(phases, precompute_visibility, floor_cache_bytes, pregenerate_floors, overworld)
+            game_worlds.append(engine.game_world)
+            games += 1
+            handler = input_handlers.EventHandler(engine)
+        elif engine.player.level.requires_level_up:
+            engine.player.level.increase_power()
+
+        if console is not None:
+            # Floors are replaced when taking the stairs, so time each new one
+            if engine.game_map is not timed_map:
+                timed_map = engine.game_map
+                if not isinstance(timed_map.render, TimedMethod):
+                    phases.wrap(timed_map, "render", "game_map.render")
+            render_start = time.perf_counter()
+            console.clear()
+            handler.on_render(console)
+            phases.add("render", time.perf_counter() - render_start)
+    elapsed = time.perf_counter() - start
+    if autosaver is not None:
+        autosaver.shutdown()
+
+    fov_caches.add(engine.game_map.fov_cache)
+    return HeadlessResult(completed, attempted, elapsed, phases, games,
+                          fov_cache_hits=sum(fov_cache.hits for fov_cache in fov_caches),
+                          fov_cache_misses=sum(fov_cache.misses for fov_cache in fov_caches),
+                          autosaver=autosaver,
+                          floor_cache_hits=sum(world.floors.hits for world in game_worlds),
+                          floor_cache_misses=sum(world.floors.misses for world in game_worlds),
+                          floor_spills=sum(world.floors.spills for world in game_worlds),
+                          pregenerated_used=sum(world.pregenerated_used for world in game_worlds),
+                          pregenerated_waits=sum(world.pregenerated_waits for world in game_worlds))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=1000, help="number of turns to simulate")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the game and the bot")
+    parser.add_argument("--bot", choices=sorted(BOTS), default="random", help="which bot plays the game")
+    parser.add_argument("--render", action="store_true", help="render every turn to an off-screen console")
+    parser.add_argument("--precompute-fov", action="store_true",
+                        help="build a visibility table for each floor in the background")
+    parser.add_argument("--fov-cache-size", type=int, default=None,
+                        help="entries kept in each floor's FOV cache, 0 disables it")
+    parser.add_argument("--floor-cache-bytes", type=int, default=None,
+                        help="memory bound for floors kept in memory, older ones are spilled to disk")
+    parser.add_argument("--no-pregenerate", action="store_true",
+                        help="generate each floor when the stairs are taken instead of in the background")
+    parser.add_argument("--overworld", action="store_true", help="start in the overworld above the dungeon")
+    parser.add_argument("--autosave", metavar="FILE", default=None,
+                        help="autosave to FILE in the background while playing")
+    parser.add_argument("--autosave-interval", type=int, default=50, help="turns between autosaves")
+    parser.add_argument("--autosave-codec", default="zlib:1", help="codec for autosaves, see save_codecs")
+    args = parser.parse_args(argv)
+
+    result = run(args.turns,
+                 BOTS[args.bot](random.Random(args.seed)),
+                 render=args.render,
+                 seed=args.seed,
+                 precompute_visibility=args.precompute_fov,
+                 fov_cache_size=args.fov_cache_size,
+                 floor_cache_bytes=args.floor_cache_bytes,
+                 pregenerate_floors=not args.no_pregenerate,
+                 overworld=args.overworld,
+                 autosave_to=args.autosave,
+                 autosave_interval=args.autosave_interval,
+                 autosave_codec=args.autosave_codec)
+    print(result.report())
+
+
+if __name__ == "__main__":
+    main()
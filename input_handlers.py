@@ -134,6 +134,10 @@ class EventHandler(BaseEventHandler):
         if action is None:
             return False
 
+        # Write ahead, so a crash during this turn can still be recovered
+        if self.engine.journal is not None:
+            self.engine.journal.record_action(self.engine, action)
+
         try:
             action.perform()
         except exceptions.Impossible as exc:
@@ -143,11 +147,21 @@ class EventHandler(BaseEventHandler):
         self.engine.handle_enemy_turns()
 
         self.engine.update_fov()
+        self.engine.turn_count += 1
         return True
 
     def ev_mousemotion(self, event: tcod.event.MouseMotion) -> None:
-        if self.engine.game_map.in_bounds(event.tile.x, event.tile.y):
-            self.engine.mouse_location = event.tile.x, event.tile.y
+        location = self.map_location(event.tile.x, event.tile.y)
+        if location is not None:
+            self.engine.mouse_location = location
+
+    # Return the map position shown at a console position, or None if there is
+    # no map there
+    def map_location(self, x: int, y: int) -> Optional[Tuple[int, int]]:
+        location = self.engine.camera.screen_to_map(x, y)
+        if location is None or not self.engine.game_map.in_bounds(*location):
+            return None
+        return location
     
     def on_render(self, console: tcod.Console) -> None:
         self.engine.render(console)
@@ -251,6 +265,8 @@ class LevelUpEventHandler(AskUserEventHandler):
         index = key - tcod.event.K_a
 
         if 0 <= index <= 2:
+            if self.engine.journal is not None:
+                self.engine.journal.record_level_up(self.engine, index)
             if index == 0:
                 player.level.increase_max_hp()
             elif index == 1:
@@ -367,9 +383,10 @@ class SelectIndexHandler(AskUserEventHandler):
     # Highlight the tile under the cursor
     def on_render(self, console: tcod.Console) -> None:
         super().on_render(console)
-        x, y = self.engine.mouse_location
-        console.tiles_rgb["bg"][x, y] = color.white
-        console.tiles_rgb["fg"][x, y] = color.black
+        location = self.engine.camera.map_to_screen(*self.engine.mouse_location)
+        if location is not None:
+            console.tiles_rgb["bg"][location] = color.white
+            console.tiles_rgb["fg"][location] = color.black
     
     # Check for key movement or confirmation keys
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[ActionOrHandler]:
@@ -387,9 +404,10 @@ class SelectIndexHandler(AskUserEventHandler):
             dx, dy = MOVE_KEYS[key]
             x += dx * modifier
             y += dy * modifier
-            # Bound the cursor to the map size
-            x = max(0, min(x, self.engine.game_map.width - 1))
-            y = max(0, min(y, self.engine.game_map.width - 1))
+            # Bound the cursor to the part of the map on screen
+            camera = self.engine.camera
+            x = max(camera.x, min(x, camera.x + camera.width - 1, self.engine.game_map.width - 1))
+            y = max(camera.y, min(y, camera.y + camera.height - 1, self.engine.game_map.height - 1))
             self.engine.mouse_location = x, y
             return None
         elif key in CONFIRM_KEYS:
@@ -398,9 +416,10 @@ class SelectIndexHandler(AskUserEventHandler):
     
     # Left cick confirms a selection
     def ev_mousebuttondown(self, event: tcod.event.MouseButtonDown) -> Optional[ActionOrHandler]:
-        if self.engine.game_map.in_bounds(*event.tile):
+        location = self.map_location(*event.tile)
+        if location is not None:
             if event.button == 1:
-                return self.on_index_selected(*event.tile)
+                return self.on_index_selected(*location)
         return super().ev_mousebuttondown(event)
     
     # Called when an index is selected
@@ -438,6 +457,7 @@ class AreaRangedAttackHandler(SelectIndexHandler):
         super().on_render(console)
 
         x, y = self.engine.mouse_location
+        x, y = x - self.engine.camera.x, y - self.engine.camera.y
 
         # Draw a rectangle around the targeted area, so the player can see the 
         # affected tiles. 
@@ -460,7 +480,8 @@ class MainGameEventHandler(EventHandler):
         key = event.sym
         modifier = event.mod
 
-        if key == tcod.event.K_PERIOD and modifier & (tcod.event.KMOD_LSHIFT | tcod.event.KMOD_RSHIFT):
+        if key in (tcod.event.K_PERIOD, tcod.event.K_COMMA) and modifier & (tcod.event.KMOD_LSHIFT | tcod.event.KMOD_RSHIFT):
+            # '>' and '<' take whichever stairs the player is on
             return actions.TakeStairsAction(player)
         if key in MOVE_KEYS:
             dx, dy = MOVE_KEYS[key]
@@ -490,6 +511,9 @@ class GameOverEventHandler(EventHandler):
     def on_quit(self) -> None:
         if os.path.exists("savegame.sav"):
             os.remove("savegame.sav")
+        # Nothing is left to recover
+        if self.engine.journal is not None:
+            self.engine.journal.discard()
         raise exceptions.QuitWithoutSaving()
     
     def ev_quit(self, event: tcod.event.Quit) -> None:
@@ -0,0 +1,327 @@
+""" Write-ahead journal of player input, for recovering from crashes.
+
+Every action given to EventHandler.handle_action and every level up choice
+is appended to the journal before it is carried out. When a snapshot (an
+autosave) is taken, a checkpoint record with the snapshot's id is appended
+too. After a crash the last snapshot is loaded and the records after its
+checkpoint are played back. The snapshot holds the Engine's random streams
+(see rng), so the replay repeats the game exactly.
+
+File layout: MAGIC and a version, then records of
+    kind (uint8), turn count (uint32), random streams fingerprint (uint32),
+    payload length (uint16), payload, CRC-32 of all of the above
+A record which is cut short or fails its CRC ends the journal, so a torn
+write at the end of the file loses only that record.
+"""
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import struct
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, TYPE_CHECKING
+import zlib
+
+import actions
+from actions import Action
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+
+MAGIC = b"YRJRNL\r\n"
+# 1: checkpoints hold the state of the global `random`
+# 2: checkpoints hold only the snapshot id
+VERSION = 2
+FILE_HEADER = struct.Struct("<8sH")
+RECORD_HEADER = struct.Struct("<BIIH")
+RECORD_CHECKSUM = struct.Struct("<I")
+
+# Record kinds
+CHECKPOINT = 1
+ACTION = 2
+LEVEL_UP = 3
+
+# Level up choices, in the order of LevelUpEventHandler's menu
+LEVEL_UP_CHOICES = ("increase_max_hp", "increase_power", "increase_defense")
+
+# Action payloads start with one of these codes
+ACTION_CODES = {
+    actions.WaitAction: 0,
+    actions.PickupAction: 1,
+    actions.TakeStairsAction: 2,
+    actions.BumpAction: 3,
+    actions.MovementAction: 4,
+    actions.MeleeAction: 5,
+    actions.ItemAction: 6,
+    actions.DropItem: 7,
+    actions.EquipAction: 8,
+}
+ACTION_TYPES = {code: action_type for action_type, code in ACTION_CODES.items()}
+
+DIRECTION = struct.Struct("<bb")
+ITEM = struct.Struct("<B")
+ITEM_TARGET = struct.Struct("<Bhh")
+
+
+class JournalError(Exception):
+    """ Raised for actions which can't be journaled. """
+
+
+class Record(NamedTuple):
+    kind: int
+    turn_count: int
+    fingerprint: int
+    payload: bytes
+    # Where the record starts in the file
+    offset: int
+
+
+# Encode an action performed by the player
+def encode_action(action: Action) -> bytes:
+    code = ACTION_CODES.get(type(action))
+    if code is None:
+        raise JournalError(f"Can't journal a {type(action).__name__}.")
+    if isinstance(action, actions.ActionWithDirection):
+        return bytes([code]) + DIRECTION.pack(action.dx, action.dy)
+    if isinstance(action, actions.ItemAction):
+        index = action.entity.inventory.items.index(action.item)
+        return bytes([code]) + ITEM_TARGET.pack(index, *action.target_xy)
+    if isinstance(action, actions.EquipAction):
+        return bytes([code]) + ITEM.pack(action.entity.inventory.items.index(action.item))
+    return bytes([code])
+
+
+def decode_action(engine: Engine, payload: bytes) -> Action:
+    player = engine.player
+    action_type = ACTION_TYPES[payload[0]]
+    if issubclass(action_type, actions.ActionWithDirection):
+        return action_type(player, *DIRECTION.unpack_from(payload, 1))
+    if issubclass(action_type, actions.ItemAction):
+        index, x, y = ITEM_TARGET.unpack_from(payload, 1)
+        return action_type(player, player.inventory.items[index], (x, y))
+    if issubclass(action_type, actions.EquipAction):
+        (index,) = ITEM.unpack_from(payload, 1)
+        return action_type(player, player.inventory.items[index])
+    return action_type(player)
+
+
+class Journal:
+    """ Appends records to a journal file.
+    Records are buffered in memory and written once 'batch_size' have built
+    up or 'sync_interval' seconds have passed, then flushed to disk with fsync
+    on a worker thread, so a turn never waits on the disk. Compaction runs on
+    the same worker; while it holds the file, records stay buffered.
+    """
+    def __init__(self, filename: str, batch_size: int = 32, sync_interval: float = 1.0):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.sync_interval = sync_interval
+        self.records = 0
+        self.syncs = 0
+
+        self._file = None
+        self._buffer = bytearray()
+        self._buffered_records = 0
+        self._last_write = time.monotonic()
+        # Bytes written to the file plus bytes buffered, and where each
+        # checkpoint written by this journal starts, both counted from the
+        # start of the file before any compaction. '_dropped' bytes have been
+        # cut from the front of the file by compaction since.
+        self._size = 0
+        self._dropped = 0
+        self._checkpoints: Dict[str, int] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._sync: Optional[Future] = None
+        self._compaction: Optional[Future] = None
+        # Held while writing to or replacing the file
+        self._lock = threading.Lock()
+
+    # Open the file for appending, keeping any valid records already in it
+    # and dropping a torn record at its end
+    def _open(self) -> None:
+        end = FILE_HEADER.size
+        if os.path.exists(self.filename):
+            for record in read_records(self.filename):
+                end = record.offset + RECORD_HEADER.size + len(record.payload) + RECORD_CHECKSUM.size
+        if end == FILE_HEADER.size:
+            with open(self.filename, "wb") as f:
+                f.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self._file = open(self.filename, "r+b")
+        self._file.truncate(end)
+        self._file.seek(end)
+        self._size = end
+        self._dropped = 0
+
+    def _append(self, kind: int, engine: Engine, payload: bytes) -> None:
+        if self._file is None:
+            self._open()
+        record = RECORD_HEADER.pack(kind, engine.turn_count, engine.rng.fingerprint(), len(payload)) + payload
+        self._buffer += record
+        self._buffer += RECORD_CHECKSUM.pack(zlib.crc32(record))
+        self._size += len(record) + RECORD_CHECKSUM.size
+        self._buffered_records += 1
+        self.records += 1
+        if (self._buffered_records >= self.batch_size
+                or time.monotonic() - self._last_write >= self.sync_interval):
+            self.flush(block=False)
+
+    # Record an action about to be performed by the player
+    def record_action(self, engine: Engine, action: Action) -> None:
+        self._append(ACTION, engine, encode_action(action))
+
+    # Record a choice from LEVEL_UP_CHOICES about to be applied
+    def record_level_up(self, engine: Engine, choice: int) -> None:
+        self._append(LEVEL_UP, engine, bytes([choice]))
+
+    # Record that a snapshot with this id is being taken of the engine now
+    def checkpoint(self, engine: Engine, snapshot_id: str) -> None:
+        self._checkpoints[snapshot_id] = self._size
+        self._append(CHECKPOINT, engine, snapshot_id.encode())
+
+    # Write out buffered records and start an fsync on the worker, unless the
+    # last one is still running (the next flush will cover these records).
+    # Unless 'block' is True, nothing is written while a compaction has the
+    # file, the records are written by a later flush instead.
+    def flush(self, block: bool = True) -> None:
+        if self._file is None:
+            return
+        if not self._lock.acquire(blocking=block):
+            return
+        try:
+            if self._buffer:
+                self._file.write(self._buffer)
+                self._file.flush()
+                self._buffer.clear()
+                self._buffered_records = 0
+            self._last_write = time.monotonic()
+            if self._sync is None or self._sync.done():
+                self._sync = self._submit(os.fsync, self._file.fileno())
+                self.syncs += 1
+        finally:
+            self._lock.release()
+
+    def _submit(self, function: Callable[..., Any], *args: Any) -> Future:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Journal")
+        return self._executor.submit(function, *args)
+
+    def _wait_for_sync(self) -> None:
+        for future in (self._sync, self._compaction):
+            if future is not None:
+                future.result()
+        self._sync = self._compaction = None
+
+    # Drop the records before a checkpoint, once its snapshot is safely saved.
+    # The checkpoint is written out now and the file is rewritten on the
+    # worker, so the caller doesn't wait on the disk.
+    def compact(self, snapshot_id: str) -> None:
+        offset = self._checkpoints.get(snapshot_id)
+        if offset is None or offset - self._dropped == FILE_HEADER.size:
+            return
+        self.flush()
+        self._compaction = self._submit(self._compact, offset)
+
+    # Runs on the worker, after any fsync started before it
+    def _compact(self, offset: int) -> None:
+        with self._lock:
+            start = offset - self._dropped
+            if start <= FILE_HEADER.size:
+                return
+            self._file.seek(start)
+            tail = self._file.read()
+
+            temp_filename = f"{self.filename}.tmp"
+            with open(temp_filename, "wb") as f:
+                f.write(FILE_HEADER.pack(MAGIC, VERSION))
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(temp_filename, self.filename)
+            self._file = open(self.filename, "r+b")
+            self._file.seek(0, os.SEEK_END)
+            self._dropped = offset - FILE_HEADER.size
+
+            for key, value in list(self._checkpoints.items()):
+                if value < offset:
+                    self._checkpoints.pop(key, None)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.flush()
+            self._wait_for_sync()
+            self._file.close()
+            self._file = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    # Close and delete the journal, once a complete save makes it unneeded
+    def discard(self) -> None:
+        self.close()
+        self._checkpoints.clear()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+# Iterate over the valid records of a journal file, stopping at the first
+# one which is cut short or damaged
+def read_records(filename: str) -> Iterator[Record]:
+    with open(filename, "rb") as f:
+        data = f.read()
+    if len(data) < FILE_HEADER.size or FILE_HEADER.unpack_from(data) != (MAGIC, VERSION):
+        return
+    offset = FILE_HEADER.size
+    while offset + RECORD_HEADER.size <= len(data):
+        kind, turn_count, fingerprint, length = RECORD_HEADER.unpack_from(data, offset)
+        end = offset + RECORD_HEADER.size + length
+        if end + RECORD_CHECKSUM.size > len(data):
+            return
+        (checksum,) = RECORD_CHECKSUM.unpack_from(data, end)
+        if checksum != zlib.crc32(data[offset:end]):
+            return
+        yield Record(kind, turn_count, fingerprint, data[offset + RECORD_HEADER.size:end], offset)
+        offset = end + RECORD_CHECKSUM.size
+
+
+# Return the records following the checkpoint of a snapshot, starting with
+# that checkpoint, or an empty list if the journal doesn't have it
+def records_after(filename: str, snapshot_id: str) -> List[Record]:
+    records: List[Record] = []
+    for record in read_records(filename):
+        if record.kind == CHECKPOINT and record.payload.decode() == snapshot_id:
+            records = [record]
+        elif records:
+            records.append(record)
+    return records
+
+
+# Play back records on an engine loaded from the snapshot they follow.
+# Stops early if the game stops matching the recording. Returns the number of
+# records played back.
+def replay(engine: Engine, records: List[Record]) -> int:
+    import input_handlers
+
+    handler = input_handlers.EventHandler(engine)
+    played = 0
+    for record in records:
+        if record.kind == CHECKPOINT:
+            continue
+        if record.turn_count != engine.turn_count or record.fingerprint != engine.rng.fingerprint():
+            break
+        if record.kind == ACTION:
+            handler.handle_action(decode_action(engine, record.payload))
+        elif record.kind == LEVEL_UP:
+            getattr(engine.player.level, LEVEL_UP_CHOICES[record.payload[0]])()
+        played += 1
+    return played
+
+
+# Bring an engine loaded from a snapshot up to date from the journal. Returns
+# the number of records played back.
+def recover(engine: Engine, filename: str, snapshot_id: str) -> int:
+    if not os.path.exists(filename):
+        return 0
+    return replay(engine, records_after(filename, snapshot_id))
@@ -5,9 +5,12 @@ import traceback
 
 import tcod 
 
+from autosave import Autosaver
 import color
 import exceptions
+from frame_scheduler import FrameScheduler
 import input_handlers
+from journal import Journal
 import setup_game
 
 
@@ -16,10 +19,15 @@ def save_game(handler: input_handlers.BaseEventHandler, filename: str) -> None:
     if isinstance(handler, input_handlers.EventHandler):
         handler.engine.save_as(filename)
         print("Game saved.")
+        # The save is complete, the journal has nothing left to add
+        if handler.engine.journal is not None:
+            handler.engine.journal.discard()
 
 def main() -> None:
     SCREEN_WIDTH = 80
     SCREEN_HEIGHT = 50
+    AUTOSAVE_INTERVAL = 50  # turns
+    AUTOSAVE_CODEC = "zlib:1"
 
     tileset = tcod.tileset.load_tilesheet("dejavu10x10_gs_tc.png", 32, 8, tcod.tileset.CHARMAP_TCOD)
  
@@ -33,27 +41,42 @@ def main() -> None:
         vsync=True, 
     ) as context:
         root_console = tcod.Console(SCREEN_WIDTH, SCREEN_HEIGHT, order="F")
+        scheduler = FrameScheduler()
+        autosaver = Autosaver("savegame.sav", interval=AUTOSAVE_INTERVAL, codec=AUTOSAVE_CODEC,
+                              journal=Journal("savegame.sav.journal"))
         try:
             while True:  
-                root_console.clear()
-                handler.on_render(console=root_console)
-                context.present(root_console)          
+                # Only redraw when something on screen changed
+                if scheduler.should_draw():
+                    root_console.clear()
+                    handler.on_render(console=root_console)
+                    context.present(root_console)          
+                    scheduler.frame_drawn()
                 try: 
-                    for event in tcod.event.wait():
+                    for event in scheduler.coalesce_mouse_motion(tcod.event.wait()):
                         context.convert_event(event)
+                        before = scheduler.frame_state(handler)
                         handler = handler.handle_events(event)
+                        scheduler.event_handled(event, before, handler)
+                        # Save in the background every few turns and on new floors
+                        if isinstance(handler, input_handlers.EventHandler):
+                            autosaver.update(handler.engine)
                 except Exception: # Handle exceptions in game
                     traceback.print_exc()  # Print error to stderr
                     # Then print the error to the message log
                     if isinstance(handler, input_handlers.EventHandler):
                         handler.engine.message_log.add_message(traceback.format_exc(), color.error)
+                    scheduler.needs_redraw = True
         
         except exceptions.QuitWithoutSaving:
+            autosaver.shutdown()
             raise 
         except SystemExit: # Save and quit
+            autosaver.shutdown()
             save_game(handler, "savegame.sav")
             raise
         except BaseException: # Save on any other unexpected exception
+            autosaver.shutdown()
             save_game(handler, "savegame.sav")
             raise
 
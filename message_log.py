@@ -1,4 +1,4 @@
-from typing import Iterable, List, Reversible, Tuple
+from typing import Callable, Iterable, List, Optional, Reversible, Tuple
 import textwrap
 
 import tcod
@@ -20,7 +20,19 @@ class Message:
 
 class MessageLog:
     def __init__(self) -> None:
-        self.messages: List[Message] = []
+        # The messages held in memory. While older history is deferred these
+        # are only the most recent ones.
+        self.loaded_messages: List[Message] = []
+        # Returns the messages older than loaded_messages, until first needed
+        self.history_loader: Optional[Callable[[], List[Message]]] = None
+
+    # Every message, loading any deferred history first
+    @property
+    def messages(self) -> List[Message]:
+        if self.history_loader is not None:
+            self.loaded_messages[:0] = self.history_loader()
+            self.history_loader = None
+        return self.loaded_messages
 
     def add_message(self, 
                     text: str, 
@@ -30,10 +42,11 @@ class MessageLog:
         'text' is the message text, 'fg' is the text color. If 'stack is True 
         then the message can stack with a previous message of the same text. 
         """
-        if stack and self.messages and text == self.messages[-1].plain_text:
-            self.messages[-1].count += 1
+        messages = self.loaded_messages
+        if stack and messages and text == messages[-1].plain_text:
+            messages[-1].count += 1
         else:
-            self.messages.append(Message(text, fg))
+            messages.append(Message(text, fg))
         
     def render(self, 
                console: tcod.Console,
@@ -46,7 +59,7 @@ class MessageLog:
                'x', 'y', 'width', 'height' are the rectangular region to render
                onto the 'console'. 
                """
-               self.render_messages(console, x, y, width, height, self.messages)
+               self.render_messages(console, x, y, width, height, self.loaded_messages)
 
     # Return a wrapped text message
     @staticmethod
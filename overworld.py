@@ -0,0 +1,224 @@
+""" An open overworld, streamed in chunks around the player.
+
+The overworld has no edges. It is split into chunks of CHUNK_SIZE by
+CHUNK_SIZE tiles, made by procgen.generate_chunk from random streams of their
+own the first time the player comes near them. Only a square window of chunks
+around the player's chunk is held in the map's arrays: OverworldMap is a
+GameMap of that window, so field of view, pathfinding, rendering and
+everything else work on it unchanged, in window coordinates.
+
+When the player gets within 'margin' tiles of the window's edge the window
+moves, putting the player's chunk back in the middle. Chunks falling out of it
+are serialized with their entities into a ChunkStore, which keeps the most
+recent ones in memory and spills the rest to files; chunks coming into it are
+read back from the store, or generated if they never were. So the memory used
+stays about the same however far the player walks.
+"""
+from __future__ import annotations
+
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from game_map import GameMap
+from spill_store import SpillStore
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+
+CHUNK_SIZE = 64
+
+# Chunk coordinates, in chunks from the chunk holding the dungeon's entrance
+ChunkKey = Tuple[int, int]
+
+
+class ChunkStore(SpillStore[ChunkKey, bytes]):
+    """ Keeps the chunks of an overworld which are out of its window, by chunk
+    coordinates, serialized with 'codec' by savefile.encode_chunk. The most
+    recently stored chunks stay in memory as long as they fit in 'max_bytes',
+    older ones are spilled to disk, see SpillStore.
+    """
+    prefix = "chunks-"
+
+    def __init__(self, max_bytes: int = 1024 * 1024, codec: str = "zlib:1"):
+        self.codec = codec
+        super().__init__(max_bytes)
+
+    # Remove a chunk from the store and return it, or None if it was never
+    # stored
+    def take(self, key: ChunkKey) -> Optional[bytes]:
+        data = self.pop(key)
+        return self.pop_spilled(key) if data is None else data
+
+
+# Copy the contents of a 2d array 'dx' columns left and 'dy' rows up, in
+# place. What is left behind at the other edges is unchanged.
+def _shift_array(array: np.ndarray, dx: int, dy: int) -> None:
+    width, height = array.shape
+    source = array[max(dx, 0):width + min(dx, 0), max(dy, 0):height + min(dy, 0)].copy()
+    array[max(-dx, 0):width + min(-dx, 0), max(-dy, 0):height + min(-dy, 0)] = source
+
+
+class OverworldMap(GameMap):
+    """ The part of the overworld around the player, see the module docstring.
+    The window is 'load_radius' chunks on each side of the player's chunk.
+    'origin' is the chunk at the window's top left corner, by default the one
+    putting the chunk with the dungeon's entrance in the middle. The window
+    starts out as walls, load_window fills it.
+    """
+    def __init__(self,
+                 engine: Engine,
+                 *,
+                 chunk_size: int = CHUNK_SIZE,
+                 load_radius: int = 1,
+                 margin: Optional[int] = None,
+                 origin: Optional[ChunkKey] = None,
+                 chunks: Optional[ChunkStore] = None):
+        size = chunk_size * (2 * load_radius + 1)
+        super().__init__(engine, size, size)
+        self.chunk_size = chunk_size
+        self.load_radius = load_radius
+        # Half a chunk by default, so walking back and forth over a chunk
+        # border doesn't move the window every step
+        self.margin = chunk_size // 2 if margin is None else margin
+        if not 0 <= self.margin <= chunk_size * load_radius:
+            raise ValueError(f"margin must be between 0 and {chunk_size * load_radius}, not {self.margin}.")
+        self.origin: ChunkKey = (-load_radius, -load_radius) if origin is None else origin
+        self.chunks = ChunkStore() if chunks is None else chunks
+        # Chunks generated, read back from the store, and put into it
+        self.chunks_generated = 0
+        self.chunks_loaded = 0
+        self.chunks_evicted = 0
+
+        # The stairs down to the dungeon are in the middle of chunk (0, 0),
+        # and the player starts next to them
+        stairs_x, stairs_y = self.world_to_window(chunk_size // 2, chunk_size // 2)
+        self.downstairs_location = (stairs_x, stairs_y)
+        self.entrance = (stairs_x - 2, stairs_y)
+
+    @property
+    def nbytes(self) -> int:
+        return super().nbytes + self.chunks.nbytes
+
+    # Monsters only chase a player they can see, so paths to the player are
+    # searched for within 'margin' tiles of them, which are always loaded,
+    # rather than across the whole window
+    def pathfinding_area(self, x: int, y: int) -> Tuple[slice, slice]:
+        return (slice(max(0, x - self.margin), x + self.margin + 1),
+                slice(max(0, y - self.margin), y + self.margin + 1))
+
+    # Convert between overworld tile coordinates and this map's coordinates
+    def world_to_window(self, x: int, y: int) -> Tuple[int, int]:
+        return x - self.origin[0] * self.chunk_size, y - self.origin[1] * self.chunk_size
+
+    def window_to_world(self, x: int, y: int) -> Tuple[int, int]:
+        return x + self.origin[0] * self.chunk_size, y + self.origin[1] * self.chunk_size
+
+    # Return the chunks in the window, in row order
+    def window_chunks(self) -> List[ChunkKey]:
+        span = 2 * self.load_radius + 1
+        origin_x, origin_y = self.origin
+        return [(origin_x + i, origin_y + j) for j in range(span) for i in range(span)]
+
+    # Return the window coordinates of a chunk's top left tile
+    def chunk_location(self, key: ChunkKey) -> Tuple[int, int]:
+        return self.world_to_window(key[0] * self.chunk_size, key[1] * self.chunk_size)
+
+    # Fill every chunk of the window, from the store or by generating it
+    def load_window(self) -> None:
+        for key in self.window_chunks():
+            self._load_chunk(key)
+        self.tiles_changed()
+
+    # Move the window if the player at (x, y) is within 'margin' tiles of its
+    # edge, so that their chunk is in the middle again
+    def stream_around(self, x: int, y: int) -> None:
+        low, high = self.margin, self.width - self.margin
+        if low <= x < high and low <= y < high:
+            return
+        self.shift_window(x // self.chunk_size - self.load_radius, y // self.chunk_size - self.load_radius)
+
+    # Move the window 'dx' chunks right and 'dy' chunks down. Everything on
+    # the map, and every position kept by the map, the engine and the
+    # actors' AI, moves by as many tiles the other way.
+    def shift_window(self, dx: int, dy: int) -> None:
+        if dx == dy == 0:
+            return
+        old_chunks = set(self.window_chunks())
+        new_chunks = {(cx + dx, cy + dy) for cx, cy in old_chunks}
+        for key in sorted(old_chunks - new_chunks):
+            self._evict_chunk(key)
+
+        tiles_x, tiles_y = dx * self.chunk_size, dy * self.chunk_size
+        _shift_array(self.tiles, tiles_x, tiles_y)
+        _shift_array(self.explored, tiles_x, tiles_y)
+        self.visible[...] = False
+        self.origin = (self.origin[0] + dx, self.origin[1] + dy)
+        # Drops the movement costs, so they are rebuilt from the new positions
+        self.tiles_changed()
+        self.fov_cache.clear()
+
+        for entity in sorted(self.entities, key=self.entity_store.rows.__getitem__):
+            entity.x -= tiles_x
+            entity.y -= tiles_y
+            self.refresh_entity(entity)
+        for actor in self.actors:
+            ai = actor.ai
+            while ai is not None:
+                if getattr(ai, "path", None):
+                    ai.path = [(x - tiles_x, y - tiles_y) for x, y in ai.path]
+                ai = getattr(ai, "previous_ai", None)
+
+        self.downstairs_location = (self.downstairs_location[0] - tiles_x, self.downstairs_location[1] - tiles_y)
+        self.entrance = (self.entrance[0] - tiles_x, self.entrance[1] - tiles_y)
+        engine = self.engine
+        engine.mouse_location = (engine.mouse_location[0] - tiles_x, engine.mouse_location[1] - tiles_y)
+        engine.player_distance_map = None
+
+        for key in sorted(new_chunks - old_chunks):
+            self._load_chunk(key)
+        self.tiles_changed()
+
+    # Serialize a chunk of the window, with the entities on it, into the
+    # store and take the entities off the map
+    def _evict_chunk(self, key: ChunkKey) -> None:
+        import savefile
+
+        x, y = self.chunk_location(key)
+        area = slice(x, x + self.chunk_size), slice(y, y + self.chunk_size)
+        store = self.entity_store
+        on_chunk = (store.in_use & (store.x >= x) & (store.x < x + self.chunk_size)
+                    & (store.y >= y) & (store.y < y + self.chunk_size))
+        entities = store.select(on_chunk)
+        for entity in entities:
+            self.remove_entity(entity)
+            # Kept relative to the chunk, which may come back anywhere
+            entity.x -= x
+            entity.y -= y
+        data = savefile.encode_chunk(self, self.tiles[area], self.explored[area], entities, self.chunks.codec)
+        self.chunks.put(key, data)
+        self.chunks_evicted += 1
+
+    # Fill a chunk of the window from the store, or generate it
+    def _load_chunk(self, key: ChunkKey) -> None:
+        import procgen
+        import savefile
+
+        x, y = self.chunk_location(key)
+        area = slice(x, x + self.chunk_size), slice(y, y + self.chunk_size)
+        data = self.chunks.take(key)
+        if data is None:
+            self.explored[area] = False
+            procgen.generate_chunk(self, key, x, y)
+            self.chunks_generated += 1
+            return
+
+        tiles, explored, entities = savefile.decode_chunk(data, self)
+        self.tiles[area] = tiles
+        self.explored[area] = explored
+        for entity in entities:
+            entity.x += x
+            entity.y += y
+            self.add_entity(entity)
+        self.chunks_loaded += 1
@@ -1,63 +1,22 @@
 from __future__ import annotations
 import random
-from typing import Dict, Iterator, Tuple, List, TYPE_CHECKING
-import tcod
+from typing import Optional, Tuple, List, TYPE_CHECKING, Union
+
+import numpy as np
 
 from game_map import GameMap
+from spawn_tables import SpawnTables
 import tile_types
-import entity_factories
 
 if TYPE_CHECKING:
     from engine import Engine
     from entity import Entity
+    from overworld import ChunkKey, OverworldMap
 
 
-max_items_by_floor = [(1, 1), (4, 2)]
-max_monsters_by_floor = [(1, 2), (4, 3), (6, 5)]
-
-item_chances: Dict[int, List[Tuple[Entity, int]]] = {
-    0: [(entity_factories.health_potion, 35)], 
-    2: [(entity_factories.confusion_scroll, 10)], 
-    4: [(entity_factories.lightning_scroll, 25), (entity_factories.sword, 5)], 
-    6: [(entity_factories.fireball_scroll, 25), (entity_factories.chain_mail, 15)] }
-
-enemy_chances: Dict[int, List[Tuple[Entity, int]]] = {
-    0: [(entity_factories.orc, 80)], 
-    3: [(entity_factories.troll, 15)], 
-    5: [(entity_factories.troll, 30)], 
-    7: [(entity_factories.troll, 60)] }
-
-def get_max_value_for_floor(max_value_by_floor: List[Tuple[int, int]], floor: int) -> int:
-    current_value = 0
-    for floor_minimum, value in max_value_by_floor:
-        if floor_minimum > floor:
-            break
-        else:
-            current_value = value 
-    return current_value
-
-def get_entities_at_random(weighted_chances_by_floor: Dict[int, List[Tuple[Entity, int]]], 
-                           number_of_entities: int, 
-                           floor: int) -> List[Entity]:
-    entity_weighted_chances = {}
-
-    for key, values in weighted_chances_by_floor.items():
-        if key > floor:
-            break
-        else:
-            for value in values:
-                entity = value[0]
-                weighted_chance = value[1]
-
-                entity_weighted_chances[entity] = weighted_chance
-
-    entities = list(entity_weighted_chances.keys())
-    entity_weighted_chance_values = list(entity_weighted_chances.values())
-
-    chosen_entities = random.choices(entities, 
-                                     weights = entity_weighted_chance_values, 
-                                     k = number_of_entities)
-    return chosen_entities
+# Which monsters and items spawn on each floor, see spawn_tables. Replace it
+# to generate with other tables.
+spawn_tables = SpawnTables.load()
 
 
 class RectangularRoom:
@@ -78,6 +37,11 @@ class RectangularRoom:
     def inner(self) -> Tuple[slice, slice]:
         return slice(self.x1 + 1, self.x2), slice(self.y1 + 1, self.y2)
 
+    # Return the whole room, walls included, as a 2d array index
+    @property
+    def outer(self) -> Tuple[slice, slice]:
+        return slice(self.x1, self.x2 + 1), slice(self.y1, self.y2 + 1)
+
     # Return True if this room overlaps with another RectangularRoom
     def intersects(self, other: RectangularRoom):
         return(
@@ -88,40 +52,60 @@ class RectangularRoom:
         )
 
 
+# Spawn monsters and items in every room of a floor, except on the
+# 'keep_clear' tile. The number of each in every room is picked first, then
+# the monsters and items of all the rooms in one go from the floor's compiled
+# spawn tables, then where each goes in its room.
 def place_entities(
-    room: RectangularRoom, dungeon: GameMap, floor_number: int,
+    rooms: List[RectangularRoom], dungeon: GameMap, floor_number: int, rng: random.Random,
+    keep_clear: Optional[Tuple[int, int]] = None,
 ) -> None: 
-    number_of_monsters = random.randint(0, get_max_value_for_floor(max_monsters_by_floor, floor_number))
-    number_of_items = random.randint(0, get_max_value_for_floor(max_items_by_floor, floor_number))
-    monsters: List[Entity] = get_entities_at_random(enemy_chances, number_of_monsters, floor_number)
-    items: List[Entity] = get_entities_at_random(item_chances, number_of_items, floor_number)
-    
-    for entity in monsters + items:
-        x = random.randint(room.x1 + 1, room.x2 - 1)
-        y = random.randint(room.y1 + 1, room.y2 - 1)
+    max_monsters = spawn_tables.max_monsters(floor_number)
+    max_items = spawn_tables.max_items(floor_number)
+    counts = [(rng.randint(0, max_monsters), rng.randint(0, max_items)) for _ in rooms]
+
+    monsters = iter(spawn_tables.enemies(floor_number).sample(rng, sum(count[0] for count in counts)))
+    items = iter(spawn_tables.items(floor_number).sample(rng, sum(count[1] for count in counts)))
+
+    for room, (number_of_monsters, number_of_items) in zip(rooms, counts):
+        entities: List[Entity] = [next(monsters) for _ in range(number_of_monsters)]
+        entities += [next(items) for _ in range(number_of_items)]
+        for entity in entities:
+            x = rng.randint(room.x1 + 1, room.x2 - 1)
+            y = rng.randint(room.y1 + 1, room.y2 - 1)
+
+            if (x, y) != keep_clear and not dungeon.get_entities_at_location(x, y):
+                entity.spawn(dungeon, x, y)
 
-        if not any(entity.x == x and entity.y == y for entity in dungeon.entities):
-            entity.spawn(dungeon, x, y)
 
+# A straight run of tiles as a 2d array index, one axis a slice and the other
+# a single row or column
+TunnelLeg = Tuple[Union[slice, int], Union[slice, int]]
 
 
-# Return an L-shaped tunnel between these two points
-def tunnel_between(start: Tuple[int, int], end: Tuple[int, int]
-    ) -> Iterator[Tuple[int, int]]:
+# Return the slice covering a and b and everything between them
+def span(a: int, b: int) -> slice:
+    return slice(min(a, b), max(a, b) + 1)
+
+
+# Return the two straight legs of an L-shaped tunnel between these two points,
+# ready to be assigned to in one go each
+def tunnel_between(start: Tuple[int, int], end: Tuple[int, int], rng: random.Random
+    ) -> Tuple[TunnelLeg, TunnelLeg]:
     x1, y1 = start
     x2, y2 = end
-    if random.random() < 0.5: 
-        corner_x, corner_y = x2, y1  # Move horizontally, then vertically
+    if rng.random() < 0.5: 
+        # Move horizontally, then vertically
+        return (span(x1, x2), y1), (x2, span(y1, y2))
     else:
-        corner_x, corner_y = x1, y2  # Move vertically, then horizontally
-    
-    # Generate the coordinates for this tunnel
-    for x, y in tcod.los.bresenham((x1, y1), (corner_x, corner_y)).tolist():
-        yield x, y
-    for x, y in tcod.los.bresenham((corner_x, corner_y), (x2, y2)).tolist():
-        yield x, y 
+        # Move vertically, then horizontally
+        return (x1, span(y1, y2)), (span(x1, x2), y2)
 
 
+# Generate a new dungeon map for 'floor', by default the current one. Floors
+# below 'top_floor' have stairs back up. The player is moved onto it unless
+# 'place_player' is False, which leaves the engine untouched so the map can be
+# made on another thread.
 def generate_dungeon(
     max_rooms: int, 
     room_min_size: int,
@@ -129,45 +113,120 @@ def generate_dungeon(
     map_width: int, 
     map_height: int, 
     engine: Engine, 
+    floor: Optional[int] = None, 
+    top_floor: int = 1, 
+    place_player: bool = True, 
 ) -> GameMap:
-    # Generate a new dungeon map
-    player = engine.player
-    dungeon = GameMap(engine, map_width, map_height, entities=[player])
+    dungeon = GameMap(engine, map_width, map_height)
+    if floor is None:
+        floor = engine.game_world.current_floor
+    # Seeded for this floor alone, see rng
+    layout_rng, spawns_rng = engine.rng.floor_streams(floor)
 
-    rooms: List[RectangularRoom] = []
+    rooms: List[RectangularRoom] = dungeon.rooms
     center_of_last_room = (0, 0)
+    # Tiles taken by the rooms so far, walls included, and tiles to be dug
+    # out. Setting a bool is much cheaper than setting a tile, so the floor is
+    # written to the map once at the end.
+    occupied = np.zeros((map_width, map_height), dtype=bool)
+    dug = np.zeros((map_width, map_height), dtype=bool)
 
     for r in range(max_rooms):
-        room_width = random.randint(room_min_size, room_max_size)
-        room_height = random.randint(room_min_size, room_max_size)
+        room_width = layout_rng.randint(room_min_size, room_max_size)
+        room_height = layout_rng.randint(room_min_size, room_max_size)
 
-        x = random.randint(0, dungeon.width - room_width - 1)
-        y = random.randint(0, dungeon.height - room_height - 1)
+        x = layout_rng.randint(0, dungeon.width - room_width - 1)
+        y = layout_rng.randint(0, dungeon.height - room_height - 1)
 
         # RectangularRoom class makes rectangles easier to work with
         new_room = RectangularRoom(x, y, room_width, room_height)
 
-        # Run through the other rooms and see if they intersect with this one
-        if any(new_room.intersects(other_room) for other_room in rooms):
+        # Skip this room if it would overlap any of the others
+        if occupied[new_room.outer].any():
             continue 
+        occupied[new_room.outer] = True
 
         # Dig out this room's inner area
-        dungeon.tiles[new_room.inner] = tile_types.floor
+        dug[new_room.inner] = True
 
         # If this is the first generated room, start the player here
         if len(rooms) == 0:
-            player.place(*new_room.center, dungeon)
+            dungeon.entrance = new_room.center
         else:
-            for x, y in tunnel_between(rooms[-1].center, new_room.center):
-                dungeon.tiles[x, y] = tile_types.floor
+            for leg in tunnel_between(rooms[-1].center, new_room.center, layout_rng):
+                dug[leg] = True
             
             center_of_last_room = new_room.center
-        
-        place_entities(new_room, dungeon, engine.game_world.current_floor)
 
+        rooms.append(new_room)
+
+    dungeon.tiles[dug] = tile_types.floor
+    place_entities(rooms, dungeon, floor, spawns_rng, keep_clear = dungeon.entrance)
+
+    # The stairs down are in the last room
+    if rooms:
         dungeon.tiles[center_of_last_room] = tile_types.down_stairs
         dungeon.downstairs_location = center_of_last_room
 
-        rooms.append(new_room)
+    # Below the top floor the player arrives on stairs leading back up
+    if floor > top_floor and rooms:
+        dungeon.tiles[rooms[0].center] = tile_types.up_stairs
+        dungeon.upstairs_location = rooms[0].center
+
+    if place_player:
+        engine.player.place(*dungeon.entrance, dungeon)
         
-    return dungeon
\ No newline at end of file
+    return dungeon
+
+
+# Rock outcrops and clearings with monsters and items in them, per overworld
+# chunk, see generate_chunk
+max_outcrops_per_chunk = 24
+max_clearings_per_chunk = 3
+
+
+# Generate chunk 'key' of an overworld into the map's window, with the chunk's
+# top left tile at (x, y). A chunk is open ground broken up by rock outcrops,
+# with a few clearings holding monsters and items as tough as those of the
+# floor as deep as the chunk is far from chunk (0, 0), which has the stairs
+# down to the dungeon. Each chunk is seeded for itself alone, see rng.
+def generate_chunk(overworld: OverworldMap, key: ChunkKey, x: int, y: int) -> None:
+    size = overworld.chunk_size
+    layout_rng, spawns_rng = overworld.engine.rng.chunk_streams(*key)
+
+    rock = np.zeros((size, size), dtype=bool)
+    for _ in range(layout_rng.randint(0, max_outcrops_per_chunk)):
+        width = layout_rng.randint(1, 6)
+        height = layout_rng.randint(1, 6)
+        left = layout_rng.randint(0, size - width)
+        top = layout_rng.randint(0, size - height)
+        rock[left:left + width, top:top + height] = True
+
+    clearings: List[RectangularRoom] = []
+    for _ in range(layout_rng.randint(1, max_clearings_per_chunk)):
+        width = layout_rng.randint(6, 10)
+        height = layout_rng.randint(6, 10)
+        clearing = RectangularRoom(layout_rng.randint(0, size - width - 1),
+                                   layout_rng.randint(0, size - height - 1),
+                                   width,
+                                   height)
+        rock[clearing.outer] = False
+        clearings.append(clearing)
+
+    # Keep the ground around the stairs and the player's starting point clear
+    stairs_x, stairs_y = overworld.downstairs_location
+    if key == (0, 0):
+        rock[stairs_x - x - 4:stairs_x - x + 5, stairs_y - y - 4:stairs_y - y + 5] = False
+
+    tiles = overworld.tiles[x:x + size, y:y + size]
+    tiles[...] = tile_types.floor
+    tiles[rock] = tile_types.wall
+    if key == (0, 0):
+        overworld.tiles[stairs_x, stairs_y] = tile_types.down_stairs
+
+    level = 1 + max(abs(key[0]), abs(key[1]))
+    rooms = [
+        RectangularRoom(clearing.x1 + x, clearing.y1 + y, clearing.x2 - clearing.x1, clearing.y2 - clearing.y1)
+        for clearing in clearings
+    ]
+    place_entities(rooms, overworld, level, spawns_rng, keep_clear = overworld.entrance)
@@ -0,0 +1,174 @@
+""" Fast copies of prototype entities, such as those in entity_factories.
+
+Copying a prototype with copy.deepcopy walks its whole object graph (the
+Actor, its Fighter, Equipment, Inventory, Level and AI) every time, looking
+each object up in a memo dict and dispatching on its type. A PrototypeRegistry
+walks the graph once per prototype instead and compiles it into a Recipe: the
+class of every object in it, the attribute values to share with the prototype
+(numbers, strings, tuples, enums, classes and the like, which can't change),
+and which attributes point at other objects of the graph, such as components
+and their parent back-references. Cloning then creates fresh objects straight
+from the recipe, giving the same result as deepcopy.
+
+Recipes are snapshots, so a prototype must not be changed once it has been
+cloned, or PrototypeRegistry.forget must be called after changing it. Entities
+that are already on a map or in an inventory are copied with deepcopy, since
+they change as the game goes on.
+"""
+from __future__ import annotations
+
+import copy
+import enum
+import types
+from typing import Any, Dict, List, Tuple, TypeVar
+import weakref
+
+
+T = TypeVar("T")
+
+# Types whose instances can be shared between the prototype and its clones
+IMMUTABLE_TYPES = (type(None), bool, int, float, complex, str, bytes, range, enum.Enum,
+                   type, types.FunctionType, types.BuiltinFunctionType)
+
+
+# Return True if 'value' can never change, so clones can share it
+def is_immutable(value: Any) -> bool:
+    if isinstance(value, (tuple, frozenset)):
+        return all(is_immutable(item) for item in value)
+    return isinstance(value, IMMUTABLE_TYPES)
+
+
+# Attributes of a list or object in a recipe: values shared as they are,
+# indices of other objects in the recipe, and values deepcopied on each clone
+Shared = Dict[Any, Any]
+References = Tuple[Tuple[Any, int], ...]
+Copied = Tuple[Tuple[Any, Any], ...]
+
+
+class Recipe:
+    """ How to build a copy of one prototype, see the module docstring.
+    Object 0 is the prototype itself, the others are in the order they were
+    found in.
+    """
+    def __init__(self, prototype: Any):
+        # For each object, its class (or list) and its attributes (or items)
+        self.classes: List[type] = []
+        # The ids of the prototype's own objects, to map them to their copies
+        # when deepcopying the values outside the recipe
+        self.ids: List[int] = []
+        self.shared: List[Shared] = []
+        self.references: List[References] = []
+        self.copied: List[Copied] = []
+        self._index: Dict[int, int] = {}
+        self._add(prototype)
+        del self._index
+
+    def __len__(self) -> int:
+        return len(self.classes)
+
+    # Return True if an object can be compiled into the recipe. Anything that
+    # controls how it's copied itself, or has no __dict__, is left to deepcopy.
+    @staticmethod
+    def _compilable(value: Any) -> bool:
+        if type(value) is list:
+            return True
+        cls = type(value)
+        return (
+            hasattr(value, "__dict__")
+            and not hasattr(cls, "__slots__")
+            and not hasattr(value, "__deepcopy__")
+            and cls.__reduce_ex__ is object.__reduce_ex__
+            and getattr(cls, "__getstate__", None) is getattr(object, "__getstate__", None)
+            and not hasattr(cls, "__setstate__")
+        )
+
+    # Add an object and everything it refers to, returning its index
+    def _add(self, obj: Any) -> int:
+        index = len(self.classes)
+        self._index[id(obj)] = index
+        self.classes.append(type(obj))
+        self.ids.append(id(obj))
+        self.shared.append({})
+        self.references.append(())
+        self.copied.append(())
+
+        items = enumerate(obj) if type(obj) is list else vars(obj).items()
+        shared: Shared = {}
+        references = []
+        copied = []
+        for key, value in items:
+            if is_immutable(value):
+                shared[key] = value
+            elif id(value) in self._index:
+                references.append((key, self._index[id(value)]))
+            elif self._compilable(value):
+                references.append((key, self._add(value)))
+            else:
+                copied.append((key, value))
+
+        self.shared[index] = shared
+        self.references[index] = tuple(references)
+        self.copied[index] = tuple(copied)
+        return index
+
+    # Build a new copy of the prototype
+    def build(self) -> Any:
+        objects = [[] if cls is list else cls.__new__(cls) for cls in self.classes]
+        # Values outside the recipe are deepcopied together, so anything they
+        # share stays shared, and what they refer to in the recipe is the copy
+        memo: Dict[int, Any] = {}
+        if any(self.copied):
+            memo.update(zip(self.ids, objects))
+        for obj, cls, shared, references, copied in zip(
+            objects, self.classes, self.shared, self.references, self.copied
+        ):
+            if cls is list:
+                items: Dict[Any, Any] = dict(shared)
+                items.update((key, objects[index]) for key, index in references)
+                items.update((key, copy.deepcopy(value, memo)) for key, value in copied)
+                obj.extend(items[key] for key in range(len(items)))
+            else:
+                state = obj.__dict__
+                state.update(shared)
+                for key, index in references:
+                    state[key] = objects[index]
+                for key, value in copied:
+                    state[key] = copy.deepcopy(value, memo)
+        return objects[0]
+
+
+class PrototypeRegistry:
+    """ Compiles prototypes into Recipes the first time they are cloned and
+    keeps the recipes for as long as the prototypes exist.
+    """
+    def __init__(self) -> None:
+        self._recipes: weakref.WeakKeyDictionary[Any, Recipe] = weakref.WeakKeyDictionary()
+
+    def __contains__(self, prototype: Any) -> bool:
+        return prototype in self._recipes
+
+    # Return the recipe of a prototype, compiling it on first use
+    def recipe(self, prototype: Any) -> Recipe:
+        recipe = self._recipes.get(prototype)
+        if recipe is None:
+            recipe = self._recipes[prototype] = Recipe(prototype)
+        return recipe
+
+    # Return a copy of 'prototype', the same as copy.deepcopy would
+    def clone(self, prototype: T) -> T:
+        # Entities which are placed somewhere are live and keep changing
+        if hasattr(prototype, "parent") or not Recipe._compilable(prototype):
+            return copy.deepcopy(prototype)
+        return self.recipe(prototype).build()
+
+    # Drop the recipe of a prototype which was changed after being cloned
+    def forget(self, prototype: Any) -> None:
+        self._recipes.pop(prototype, None)
+
+
+# The registry used by Entity.spawn and clone
+registry = PrototypeRegistry()
+
+
+def clone(prototype: T) -> T:
+    return registry.clone(prototype)
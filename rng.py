@@ -0,0 +1,82 @@
+""" Seeded random number streams.
+
+Each game has a master seed, and every part of the game which needs random
+numbers draws them from its own stream derived from that seed, so what one
+subsystem draws never shifts what another gets:
+    layout  room sizes and positions and tunnel shapes of each floor
+    spawns  the monsters and items placed on each floor
+    ai      decisions made by monsters, such as where a confused one stumbles
+    combat  chance in fights
+Floors are generated from streams of their own ("layout" and "spawns" for that
+floor number), so a floor comes out the same for a seed whichever order floors
+are generated in, on whichever thread or process. Chunks of the overworld
+likewise have "layout" and "spawns" streams keyed by their chunk coordinates.
+The other streams run for the whole game and are saved with it.
+"""
+from __future__ import annotations
+
+from array import array
+import hashlib
+import random
+from typing import Dict, Optional, Tuple
+import zlib
+
+
+STREAMS = ("layout", "spawns", "ai", "combat")
+
+
+# Derive a 64 bit seed for a named stream from a master seed
+def derive_seed(seed: int, name: str, *key: int) -> int:
+    if name not in STREAMS:
+        raise ValueError(f"Unknown random stream {name!r}, expected one of {', '.join(STREAMS)}.")
+    text = "/".join(str(part) for part in (seed, name) + key)
+    return int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+
+
+class RandomStreams:
+    """ The random number streams of one game, see the module docstring.
+    Without a 'seed' one is drawn from the global `random` module, so seeding
+    that still makes a whole run reproducible.
+    """
+    def __init__(self, seed: Optional[int] = None):
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self._streams: Dict[str, random.Random] = {}
+
+    # Return the game-long stream called 'name', created on first use
+    def stream(self, name: str) -> random.Random:
+        rng = self._streams.get(name)
+        if rng is None:
+            rng = self._streams[name] = random.Random(derive_seed(self.seed, name))
+        return rng
+
+    @property
+    def ai(self) -> random.Random:
+        return self.stream("ai")
+
+    @property
+    def combat(self) -> random.Random:
+        return self.stream("combat")
+
+    # Return a new generator for 'name' on one floor, the same every time
+    def for_floor(self, name: str, floor: int) -> random.Random:
+        return random.Random(derive_seed(self.seed, name, floor))
+
+    # The layout and spawns generators of a floor
+    def floor_streams(self, floor: int) -> Tuple[random.Random, random.Random]:
+        return self.for_floor("layout", floor), self.for_floor("spawns", floor)
+
+    # The layout and spawns generators of an overworld chunk
+    def chunk_streams(self, cx: int, cy: int) -> Tuple[random.Random, random.Random]:
+        return (random.Random(derive_seed(self.seed, "layout", cx, cy)),
+                random.Random(derive_seed(self.seed, "spawns", cx, cy)))
+
+    # A checksum of the game-long streams' states, which changes whenever a
+    # number is drawn from any of them and is the same in every process
+    def fingerprint(self) -> int:
+        checksum = 0
+        for name, rng in sorted(self._streams.items()):
+            checksum = zlib.crc32(name.encode(), checksum)
+            checksum = zlib.crc32(array("Q", rng.getstate()[1]).tobytes(), checksum)
+        return checksum
@@ -0,0 +1,128 @@
+""" Compression codecs for save files.
+
+A codec is chosen by a spec string: "lzma" or "lzma:<preset>" (0-9),
+"zlib" or "zlib:<level>" (0-9), or "raw" (also "none") for no compression.
+Save files record the codec name of each section, and data with no record
+can be recognised from the magic bytes each format starts with.
+"""
+from __future__ import annotations
+
+import lzma
+from typing import Dict, Optional, Type
+import zlib
+
+
+class Codec:
+    name = ""
+    default_level: Optional[int] = None
+    levels = range(0)
+
+    def __init__(self, level: Optional[int] = None):
+        if level is None:
+            level = self.default_level
+        elif not self.levels:
+            raise ValueError(f"{self.name} codec takes no level.")
+        elif level not in self.levels:
+            raise ValueError(f"{self.name} has no level {level}, expected {self.levels.start}-{self.levels.stop - 1}.")
+        self.level = level
+
+    # The spec string which selects this codec at this level
+    @property
+    def spec(self) -> str:
+        if self.level is None or self.level == self.default_level:
+            return self.name
+        return f"{self.name}:{self.level}"
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    # Decompression never needs to know the level
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    # True if 'data' starts like this codec's output
+    @staticmethod
+    def matches(data: bytes) -> bool:
+        return False
+
+
+class RawCodec(Codec):
+    name = "raw"
+
+    def compress(self, data: bytes) -> bytes:
+        return bytes(data)
+
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        return bytes(data)
+
+
+class LzmaCodec(Codec):
+    name = "lzma"
+    default_level = 6
+    levels = range(10)
+    magic = b"\xfd7zXZ\x00"
+
+    def compress(self, data: bytes) -> bytes:
+        return lzma.compress(data, preset=self.level)
+
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        return lzma.decompress(data)
+
+    @staticmethod
+    def matches(data: bytes) -> bool:
+        return bytes(data[:len(LzmaCodec.magic)]) == LzmaCodec.magic
+
+
+class ZlibCodec(Codec):
+    name = "zlib"
+    default_level = 6
+    levels = range(10)
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+    # A zlib stream starts with a two byte header: deflate with a window of at
+    # most 32 KiB, and a checksum making it a multiple of 31
+    @staticmethod
+    def matches(data: bytes) -> bool:
+        return (len(data) >= 2
+                and data[0] & 0x0F == 8 and data[0] >> 4 <= 7
+                and (data[0] << 8 | data[1]) % 31 == 0)
+
+
+CODECS: Dict[str, Type[Codec]] = {codec.name: codec for codec in (RawCodec, LzmaCodec, ZlibCodec)}
+
+
+# Return the codec selected by a spec string such as "zlib:1"
+def get_codec(spec: str) -> Codec:
+    name, _, level = spec.partition(":")
+    if name == "none":
+        name = "raw"
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec {spec!r}, expected one of {', '.join(sorted(CODECS))}.")
+    try:
+        return CODECS[name](int(level) if level else None)
+    except ValueError as exc:
+        raise ValueError(f"Bad codec {spec!r}: {exc}")
+
+
+def decompress(name: str, data: bytes) -> bytes:
+    try:
+        return CODECS[name].decompress(data)
+    except KeyError:
+        raise ValueError(f"Unknown codec {name!r}.")
+
+
+# Return the codec whose magic bytes 'data' starts with, or None
+def detect(data: bytes) -> Optional[Type[Codec]]:
+    for codec in CODECS.values():
+        if codec.matches(data):
+            return codec
+    return None
@@ -0,0 +1,510 @@
+""" Versioned, sectioned save files.
+
+Layout:
+    MAGIC, format version (uint16), directory length (uint32)
+    directory: UTF-8 JSON with the header and where each section is
+    section payloads, back to back
+
+The header holds a short summary of the game which can be read without
+touching the sections, for the main menu. Map arrays are stored as raw NumPy
+buffers and the message log as JSON, split into the most recent messages,
+stored uncompressed, and the older history, which is only decompressed once
+something asks for it. The remaining object graph (the player, the other
+entities on the map and the Engine's own state) as a pickle in which
+references to the Engine, GameMap and MessageLog are replaced by names, so
+none of those are pickled wholesale.
+
+Floors other than the current one are stored as "floor:<number>" sections,
+each holding a nested save (see encode_floor) which is only unpacked when the
+player returns to that floor. The chunks of an overworld outside its window
+are stored the same way, as "chunk:<x>,<y>" sections (see encode_chunk).
+"""
+from __future__ import annotations
+
+import io
+import json
+import os
+import pickle
+import struct
+import time
+import uuid
+from typing import Any, Callable, Dict, IO, List, Optional, Tuple, TYPE_CHECKING, Union
+
+import numpy as np
+
+from camera import Camera
+from engine import Engine
+from game_map import GameMap
+from message_log import Message, MessageLog
+from overworld import OverworldMap
+from rng import RandomStreams
+import save_codecs
+from save_codecs import Codec
+
+if TYPE_CHECKING:
+    from entity import Entity
+
+
+MAGIC = b"YRSAVE\r\n"
+# 1: the whole message log in the "messages" section
+# 2: older messages moved to a separate "history" section
+# 3: floors other than the current one in "floor:<number>" sections
+# 4: entities stored with their entity store rows, header has a snapshot_id
+# 5: the Engine's random streams, header has the seed
+# 6: overworld maps, with their stored chunks in "chunk:<x>,<y>" sections
+FORMAT_VERSION = 6
+PREAMBLE = struct.Struct("<8sHI")
+
+# Codec for compressed sections when none is given
+DEFAULT_CODEC = "lzma"
+
+# Number of messages stored outside the history, enough to fill the log on screen
+RECENT_MESSAGES = 20
+
+# Engine attributes which are stored in their own sections or rebuilt on load
+TRANSIENT_ENGINE_ATTRIBUTES = {"game_map", "message_log", "player_distance_map", "journal"}
+
+
+class SaveFormatError(Exception):
+    """ Raised when a file is not a save file this version can read. """
+
+
+class Section:
+    """ A named part of a save file. The payload can also be a function
+    returning it, which is then only called by whoever writes the file.
+    """
+    def __init__(self, name: str, payload: Union[bytes, Callable[[], bytes]], *, compress: bool, **meta: Any):
+        self.name = name
+        self.payload = payload
+        self.compress = compress
+        self.meta = meta
+
+
+# Pickles objects with references to the shared game objects replaced by names
+class _SharedRefPickler(pickle.Pickler):
+    def __init__(self, file: IO[bytes], shared: Dict[str, Any]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._names = {id(obj): name for name, obj in shared.items()}
+
+    def persistent_id(self, obj: Any) -> Optional[str]:
+        return self._names.get(id(obj))
+
+
+class _SharedRefUnpickler(pickle.Unpickler):
+    def __init__(self, file: IO[bytes], shared: Dict[str, Any]):
+        super().__init__(file)
+        self._shared = shared
+
+    def persistent_load(self, pid: str) -> Any:
+        try:
+            return self._shared[pid]
+        except KeyError:
+            raise pickle.UnpicklingError(f"Unknown shared object {pid!r}")
+
+
+def _shared_objects(engine: Engine, game_map: GameMap) -> Dict[str, Any]:
+    return {"engine": engine, "game_map": game_map, "message_log": engine.message_log}
+
+
+def _pickle_shared(obj: Any, shared: Dict[str, Any]) -> bytes:
+    data = io.BytesIO()
+    _SharedRefPickler(data, shared).dump(obj)
+    return data.getvalue()
+
+
+def _unpickle_shared(data: bytes, shared: Dict[str, Any]) -> Any:
+    return _SharedRefUnpickler(io.BytesIO(data), shared).load()
+
+
+def _array_section(name: str, array: np.ndarray, compress: bool = False) -> Section:
+    return Section(
+        name,
+        array.tobytes(order="F"),
+        compress=compress,
+        dtype=np.lib.format.dtype_to_descr(array.dtype),
+        shape=list(array.shape),
+    )
+
+
+# Return the sections describing a map's layout and what has been seen of it
+def _map_sections(game_map: GameMap) -> List[Section]:
+    upstairs = game_map.upstairs_location
+    map_info = {
+        "width": game_map.width,
+        "height": game_map.height,
+        "downstairs_location": list(game_map.downstairs_location),
+        "upstairs_location": list(upstairs) if upstairs else None,
+    }
+    chunk_sections = []
+    if isinstance(game_map, OverworldMap):
+        map_info["overworld"] = {
+            "chunk_size": game_map.chunk_size,
+            "load_radius": game_map.load_radius,
+            "margin": game_map.margin,
+            "origin": list(game_map.origin),
+            "entrance": list(game_map.entrance),
+        }
+        # Stored chunks are already compressed, with the ChunkStore's codec.
+        # Spilled chunks are read by the writer.
+        chunk_sections = [
+            Section(f"chunk:{cx},{cy}", data, compress=False, chunk=[cx, cy])
+            for (cx, cy), data in game_map.chunks.snapshot()
+        ]
+    return [
+        Section("map", json.dumps(map_info).encode("utf-8"), compress=False),
+        _array_section("tiles", game_map.tiles),
+        _array_section("visible", game_map.visible),
+        _array_section("explored", game_map.explored),
+    ] + chunk_sections
+
+
+# Build a GameMap, without entities, from the sections written by _map_sections
+def _read_map(reader: SaveReader, engine: Engine) -> GameMap:
+    map_info = reader.read_json("map")
+    overworld = map_info.get("overworld")
+    if overworld:
+        game_map: GameMap = OverworldMap(engine,
+                                         chunk_size = overworld["chunk_size"],
+                                         load_radius = overworld["load_radius"],
+                                         margin = overworld["margin"],
+                                         origin = tuple(overworld["origin"]))
+        game_map.entrance = tuple(overworld["entrance"])
+        for name, entry in reader.sections.items():
+            if name.startswith("chunk:"):
+                game_map.chunks.put(tuple(entry["chunk"]), bytes(reader.read_stored(name)))
+    else:
+        game_map = GameMap(engine, map_info["width"], map_info["height"])
+    game_map.tiles = reader.read_array("tiles")
+    game_map.visible = reader.read_array("visible")
+    game_map.explored = reader.read_array("explored")
+    game_map.downstairs_location = tuple(map_info["downstairs_location"])
+    if map_info.get("upstairs_location"):
+        game_map.upstairs_location = tuple(map_info["upstairs_location"])
+    return game_map
+
+
+# Serialize a floor the player isn't on, with its entities, as a nested save
+def encode_floor(game_map: GameMap, codec: Union[str, Codec] = DEFAULT_CODEC) -> bytes:
+    entities = _pickle_shared(game_map.entity_rows(), _shared_objects(game_map.engine, game_map))
+    data = io.BytesIO()
+    write_sections(data, {}, _map_sections(game_map) + [Section("entities", entities, compress=True)], codec)
+    return data.getvalue()
+
+
+# Load a floor serialized by encode_floor
+def decode_floor(data: bytes, engine: Engine) -> GameMap:
+    reader = SaveReader(io.BytesIO(data))
+    game_map = _read_map(reader, engine)
+    _add_entities(game_map, _unpickle_shared(reader.read_bytes("entities"), _shared_objects(engine, game_map)))
+    return game_map
+
+
+# Serialize one chunk of an overworld's window, given its tiles, explored
+# state and entities, as a nested save. The entities are taken to be already
+# off the map, in coordinates relative to the chunk.
+def encode_chunk(game_map: OverworldMap,
+                 tiles: np.ndarray,
+                 explored: np.ndarray,
+                 entities: List[Entity],
+                 codec: Union[str, Codec] = DEFAULT_CODEC) -> bytes:
+    data = io.BytesIO()
+    write_sections(data, {}, [
+        _array_section("tiles", tiles, compress=True),
+        _array_section("explored", explored, compress=True),
+        Section("entities", _pickle_shared(entities, _shared_objects(game_map.engine, game_map)), compress=True),
+    ], codec)
+    return data.getvalue()
+
+
+# Return the tiles, explored state and entities of a chunk serialized by
+# encode_chunk for this map
+def decode_chunk(data: bytes, game_map: OverworldMap) -> Tuple[np.ndarray, np.ndarray, List[Entity]]:
+    reader = SaveReader(io.BytesIO(data))
+    entities = _unpickle_shared(reader.read_bytes("entities"), _shared_objects(game_map.engine, game_map))
+    return reader.read_array("tiles"), reader.read_array("explored"), entities
+
+
+# Add entities saved as GameMap.entity_rows pairs, or as plain entities
+# before format 4
+def _add_entities(game_map: GameMap, entities: List[Any]) -> None:
+    for entity in entities:
+        if isinstance(entity, tuple):
+            game_map.add_entity(*entity)
+        else:
+            game_map.add_entity(entity)
+
+
+# Return the summary stored in the header of a save of this engine
+def make_header(engine: Engine) -> Dict[str, Any]:
+    player = engine.player
+    return {
+        # Identifies this save, see journal
+        "snapshot_id": uuid.uuid4().hex,
+        "seed": engine.rng.seed,
+        "saved_at": time.time(),
+        "floor": engine.game_world.current_floor,
+        "player_level": player.level.current_level,
+        "hp": player.fighter.hp,
+        "max_hp": player.fighter.max_hp,
+        "turn_count": engine.turn_count,
+    }
+
+
+# Return the header and sections which make up a save of this engine.
+# Everything is copied, so the sections can be written out on another thread.
+def engine_sections(engine: Engine) -> Tuple[Dict[str, Any], List[Section]]:
+    game_map = engine.game_map
+
+    objects = _pickle_shared({
+        "engine": {
+            key: value for key, value in engine.__dict__.items()
+            if key not in TRANSIENT_ENGINE_ATTRIBUTES
+        },
+        "entities": game_map.entity_rows(),
+    }, _shared_objects(engine, game_map))
+
+    message_log = engine.message_log
+    older = message_log.loaded_messages[:-RECENT_MESSAGES]
+    recent = message_log.loaded_messages[-RECENT_MESSAGES:]
+    if message_log.history_loader is None:
+        history: Union[bytes, Callable[[], bytes]] = _encode_messages(older)
+    else:
+        # Don't load the deferred history here, leave it to the writer
+        history_loader = message_log.history_loader
+        history = lambda: _encode_messages(history_loader() + older)
+
+    sections = _map_sections(game_map) + [
+        Section("objects", objects, compress=True),
+        Section("history", history, compress=True),
+        Section("messages", _encode_messages(recent), compress=False),
+    ]
+
+    # Stored floors are compressed with the FloorCache's codec. Those not
+    # serialized yet, or spilled to disk, are serialized or read by the writer.
+    for floor, data in engine.game_world.floors.snapshot():
+        sections.append(Section(f"floor:{floor}", data, compress=False, floor=floor))
+    return make_header(engine), sections
+
+
+# Write the preamble, directory and sections to a file. Sections marked for
+# compression are compressed with 'codec'.
+def write_sections(f: IO[bytes],
+                   header: Dict[str, Any],
+                   sections: List[Section],
+                   codec: Union[str, Codec] = DEFAULT_CODEC) -> None:
+    if isinstance(codec, str):
+        codec = save_codecs.get_codec(codec)
+    entries = []
+    payloads = []
+    offset = 0
+    for section in sections:
+        payload = section.payload if isinstance(section.payload, bytes) else section.payload()
+        if section.compress:
+            payload = codec.compress(payload)
+        entries.append({
+            "name": section.name,
+            "offset": offset,
+            "length": len(payload),
+            "codec": codec.name if section.compress else "raw",
+            **section.meta,
+        })
+        payloads.append(payload)
+        offset += len(payload)
+
+    directory = json.dumps({"header": header, "sections": entries}).encode("utf-8")
+
+    f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(directory)))
+    f.write(directory)
+    for payload in payloads:
+        f.write(payload)
+
+
+# Write a save file, replacing 'filename' only once it is complete
+def write_save(filename: str,
+               header: Dict[str, Any],
+               sections: List[Section],
+               codec: Union[str, Codec] = DEFAULT_CODEC) -> None:
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, "wb") as f:
+        write_sections(f, header, sections, codec)
+    os.replace(temp_filename, filename)
+
+
+def save_engine(engine: Engine, filename: str, codec: Union[str, Codec] = DEFAULT_CODEC) -> None:
+    header, sections = engine_sections(engine)
+    write_save(filename, header, sections, codec)
+
+
+class SaveReader:
+    """ Reads the directory of a save file, then sections on request. """
+    def __init__(self, f: IO[bytes]):
+        self.file = f
+        preamble = f.read(PREAMBLE.size)
+        if len(preamble) < PREAMBLE.size:
+            raise SaveFormatError("File is too short to be a save file.")
+        magic, self.version, directory_length = PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise SaveFormatError("Not a save file.")
+        if not 1 <= self.version <= FORMAT_VERSION:
+            raise SaveFormatError(
+                f"Save file format {self.version} is not supported by this game (up to {FORMAT_VERSION})."
+            )
+        directory = json.loads(f.read(directory_length).decode("utf-8"))
+        self.header: Dict[str, Any] = directory["header"]
+        self.sections: Dict[str, Dict[str, Any]] = {
+            entry["name"]: entry for entry in directory["sections"]
+        }
+        self._base = PREAMBLE.size + directory_length
+
+    # Return the stored (possibly compressed) bytes of a section, in a buffer
+    # NumPy can use without copying
+    def read_stored(self, name: str) -> bytearray:
+        entry = self.sections[name]
+        self.file.seek(self._base + entry["offset"])
+        data = bytearray(entry["length"])
+        if self.file.readinto(data) != entry["length"]:
+            raise SaveFormatError(f"Section {name!r} is truncated.")
+        return data
+
+    def read_bytes(self, name: str) -> bytes:
+        return self.decode(name, self.read_stored(name))
+
+    # Return the bytes of a section from what read_stored returned
+    def decode(self, name: str, data: bytearray) -> bytes:
+        return save_codecs.decompress(self.sections[name]["codec"], data)
+
+    # Return an array section, without unpickling or copying it again unless
+    # it was compressed
+    def read_array(self, name: str) -> np.ndarray:
+        entry = self.sections[name]
+        dtype = np.lib.format.descr_to_dtype(entry["dtype"])
+        data = self.read_stored(name)
+        if entry["codec"] != "raw":
+            data = bytearray(self.decode(name, data))
+        array = np.frombuffer(data, dtype=dtype)
+        return array.reshape(entry["shape"], order="F")
+
+    def read_json(self, name: str) -> Any:
+        return json.loads(self.read_bytes(name).decode("utf-8"))
+
+
+# Return True if the file starts with this format's magic bytes
+def is_save_file(filename: str) -> bool:
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+# Return the header of a save file, or None if the file has none (older saves)
+def read_header(filename: str) -> Optional[Dict[str, Any]]:
+    with open(filename, "rb") as f:
+        try:
+            return SaveReader(f).header
+        except SaveFormatError:
+            return None
+
+
+def _encode_messages(messages: List[Message]) -> bytes:
+    return json.dumps([
+        [message.plain_text, list(message.fg), message.count] for message in messages
+    ]).encode("utf-8")
+
+
+def _decode_messages(data: bytes) -> List[Message]:
+    messages = []
+    for text, fg, count in json.loads(data.decode("utf-8")):
+        message = Message(text, tuple(fg))
+        message.count = count
+        messages.append(message)
+    return messages
+
+
+# Load the recent messages now, and set up the rest of the history to be
+# decompressed the first time the whole log is needed
+def read_message_log(reader: SaveReader) -> MessageLog:
+    message_log = MessageLog()
+    message_log.loaded_messages = _decode_messages(reader.read_bytes("messages"))
+    if "history" in reader.sections:
+        stored = reader.read_stored("history")
+        message_log.history_loader = lambda: _decode_messages(reader.decode("history", stored))
+    return message_log
+
+
+def load_engine(filename: str) -> Engine:
+    with open(filename, "rb") as f:
+        reader = SaveReader(f)
+
+        engine = Engine.__new__(Engine)
+        engine.player_distance_map = None
+        engine.message_log = read_message_log(reader)
+
+        game_map = _read_map(reader, engine)
+        engine.game_map = game_map
+
+        objects = _unpickle_shared(reader.read_bytes("objects"), _shared_objects(engine, game_map))
+        engine.__dict__.update(objects["engine"])
+        # Older saves may have no random streams or camera
+        engine.__dict__.setdefault("rng", RandomStreams())
+        engine.__dict__.setdefault("camera", Camera())
+
+        # Other floors are handed over still serialized, to be loaded when
+        # the player returns to them
+        for name, entry in reader.sections.items():
+            if name.startswith("floor:"):
+                engine.game_world.floors.put_serialized(entry["floor"], reader.read_stored(name))
+
+    _add_entities(game_map, objects["entities"])
+    engine.game_world.precompute_floor(game_map)
+    return engine
+
+
+# Convert an Engine pickled by older versions of the game, which pickled the
+# whole Engine, to the current classes
+def migrate_legacy_engine(engine: Engine) -> Engine:
+    engine.__dict__.setdefault("turn_count", 0)
+    engine.__dict__.setdefault("rng", RandomStreams())
+    engine.__dict__.setdefault("camera", Camera())
+    engine.player_distance_map = None
+
+    if "messages" in engine.message_log.__dict__:
+        message_log = MessageLog()
+        message_log.loaded_messages = engine.message_log.__dict__["messages"]
+        engine.message_log = message_log
+
+    old_map = engine.game_map
+    game_map = GameMap(engine, old_map.width, old_map.height)
+    game_map.tiles = old_map.tiles
+    game_map.visible = old_map.visible
+    game_map.explored = old_map.explored
+    game_map.downstairs_location = old_map.downstairs_location
+    game_map.upstairs_location = getattr(old_map, "upstairs_location", None)
+    engine.game_map = game_map
+
+    entities: List[Entity] = list(old_map.entities)
+    for entity in entities:
+        entity.parent = game_map
+        game_map.add_entity(entity)
+    engine.game_world.precompute_floor(game_map)
+    return engine
+
+
+def load_legacy_engine(filename: str) -> Engine:
+    with open(filename, "rb") as f:
+        data = f.read()
+    # These were always lzma, but any codec recognised by its magic will do
+    codec = save_codecs.detect(data)
+    if codec is not None:
+        data = codec.decompress(data)
+    try:
+        engine = pickle.loads(data)
+    except pickle.UnpicklingError:
+        raise SaveFormatError("Not a save file.")
+    if not isinstance(engine, Engine):
+        raise SaveFormatError("Not a save file.")
+    return migrate_legacy_engine(engine)
+
+
+# Load a save file of any supported version
+def load(filename: str) -> Engine:
+    if is_save_file(filename):
+        return load_engine(filename)
+    return load_legacy_engine(filename)
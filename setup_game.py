@@ -1,9 +1,7 @@
 # Handle the loading and initialization of game sessions
 from __future__ import annotations
 
-import copy
-import lzma
-import pickle 
+import time
 import traceback 
 from typing import Optional
 
@@ -14,14 +12,23 @@ from engine import Engine
 import entity_factories
 from game_map import GameWorld
 import input_handlers
+import journal
+import prototypes
+import savefile
 
 
 # Load the background image and remove the alpha channel
 background_image = tcod.image.load("menu_background.png")[:, :, :3]
 
 
-# Return a brand new game session as an Engine instance
-def new_game() -> Engine:
+# Return a brand new game session as an Engine instance. The same 'seed'
+# always gives the same dungeon, see rng. With 'overworld' the game starts in
+# an open overworld above the dungeon instead of on its first floor.
+def new_game(*, 
+             seed: Optional[int] = None, 
+             precompute_visibility: bool = False, 
+             pregenerate_floors: bool = True, 
+             overworld: bool = False) -> Engine:
     map_width = 80
     map_height = 43
 
@@ -29,23 +36,29 @@ def new_game() -> Engine:
     room_min_size = 6
     max_rooms = 30
 
-    player = copy.deepcopy(entity_factories.player)
+    player = prototypes.clone(entity_factories.player)
 
-    sterling = Engine(player = player)
+    sterling = Engine(player = player, seed = seed)
 
     sterling.game_world = GameWorld(engine=sterling,
                                     max_rooms=max_rooms,
                                     room_min_size=room_min_size,
                                     room_max_size=room_max_size,
                                     map_width=map_width,
-                                    map_height=map_height)
-    sterling.game_world.generate_floor()
+                                    map_height=map_height,
+                                    precompute_visibility=precompute_visibility,
+                                    pregenerate_floors=pregenerate_floors,
+                                    overworld=overworld)
+    if overworld:
+        sterling.game_world.change_floor(0)
+    else:
+        sterling.game_world.descend()
     sterling.update_fov()
 
     sterling.message_log.add_message("Hello and welcome, adventurer, to yet another dungeon!", color.welcome_text)
 
-    dagger = copy.deepcopy(entity_factories.dagger)
-    leather_armor = copy.deepcopy(entity_factories.leather_armor)
+    dagger = prototypes.clone(entity_factories.dagger)
+    leather_armor = prototypes.clone(entity_factories.leather_armor)
 
     dagger.parent = player.inventory
     leather_armor.parent = player.inventory
@@ -59,12 +72,39 @@ def new_game() -> Engine:
 
 # Load an engine instance from a file
 def load_game(filename: str) -> Engine:
-    with open(filename, "rb") as f:
-        engine = pickle.loads(lzma.decompress(f.read()))
+    engine = savefile.load(filename)
     assert isinstance(engine, Engine)
+    recover_journal(engine, filename)
     return engine
 
+# Replay the turns played after the save was taken, if the game crashed
+# before it could be saved again
+def recover_journal(engine: Engine, filename: str) -> int:
+    header = savefile.read_header(filename) if savefile.is_save_file(filename) else None
+    if not header or "snapshot_id" not in header:
+        return 0
+    recovered = journal.recover(engine, f"{filename}.journal", header["snapshot_id"])
+    if recovered:
+        engine.message_log.add_message(f"Recovered {recovered} actions after the last save.", color.welcome_text)
+    return recovered
+
+# Return a one line summary of a save file for the main menu, or None if there
+# is no save or it has no header. Only the header is read.
+def describe_save(filename: str) -> Optional[str]:
+    try:
+        header = savefile.read_header(filename)
+    except OSError:
+        return None
+    if header is None:
+        return None
+    saved_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(header["saved_at"]))
+    return (f"Floor {header['floor']}, level {header['player_level']}, "
+            f"HP {header['hp']}/{header['max_hp']}, turn {header['turn_count']} ({saved_at})")
+
 class MainMenu(input_handlers.BaseEventHandler):
+    def __init__(self) -> None:
+        self.save_description = describe_save("savegame.sav")
+
     # Render the main menu on a background image
     def on_render(self, console: tcod.Console) -> None:
         console.draw_semigraphics(background_image, 0, 0)
@@ -80,8 +120,9 @@ class MainMenu(input_handlers.BaseEventHandler):
                       fg = color.menu_title, 
                       alignment = tcod.CENTER)
         
-        menu_width = 24
+        menu_width = 26
         for i, text in enumerate(["[N] Play a new game", 
+                                  "[O] Play in the overworld", 
                                   "[C] Continue last game", 
                                   "[Q] Quit"]):
             console.print(console.width // 2,
@@ -91,6 +132,13 @@ class MainMenu(input_handlers.BaseEventHandler):
                           bg = color.black, 
                           alignment = tcod.CENTER,
                           bg_blend = tcod.BKGND_ALPHA(64))
+
+        if self.save_description:
+            console.print(console.width // 2,
+                          console.height // 2 + 3,
+                          self.save_description,
+                          fg = color.menu_text,
+                          alignment = tcod.CENTER)
     
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[input_handlers.BaseEventHandler]:
         if event.sym in (tcod.event.K_q, tcod.event.K_ESCAPE):
@@ -105,6 +153,8 @@ class MainMenu(input_handlers.BaseEventHandler):
                 return input_handlers.PopupMessage(self, f"Failed to load save: \n{exc}")
         elif event.sym == tcod.event.K_n:
             return input_handlers.MainGameEventHandler(new_game())
+        elif event.sym == tcod.event.K_o:
+            return input_handlers.MainGameEventHandler(new_game(overworld=True))
 
         return None
 
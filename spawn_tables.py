@@ -0,0 +1,149 @@
+""" The tables of which monsters and items are spawned on each floor, and how
+many, compiled per floor for fast sampling.
+
+The tables are read from a JSON file, by default spawn_tables.json:
+    max_items_by_floor     [[floor, value], ...] most items per room from
+    max_monsters_by_floor  each floor on, in increasing floor order
+    item_chances           {"floor": [[entity, weight], ...], ...} weights of
+    enemy_chances          the entities from each floor on
+Entities are named as in entity_factories. A weight given on a later floor
+replaces the one given earlier for the same entity.
+
+The first time a floor's tables are asked for they are compiled into
+SpawnTable objects holding the floor's entities and their cumulative weights,
+which are kept by floor number. Sampling any number of entities is then a
+binary search per entity, rather than rebuilding the weights every time.
+"""
+from __future__ import annotations
+
+from bisect import bisect
+from itertools import accumulate
+import json
+import os
+import random
+from typing import Any, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from entity import Entity
+
+
+DEFAULT_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spawn_tables.json")
+
+TABLES = ("max_items_by_floor", "max_monsters_by_floor", "item_chances", "enemy_chances")
+
+# [(first floor, value), ...] and {first floor: [(entity, weight), ...], ...}
+ValueTable = List[Tuple[int, int]]
+ChanceTable = Dict[int, List[Tuple["Entity", int]]]
+
+
+class SpawnTable:
+    """ Weighted entities to spawn on one floor, with cumulative weights. """
+    def __init__(self, entities: Sequence[Entity], weights: Sequence[int]):
+        self.entities = tuple(entities)
+        self.cumulative_weights = list(accumulate(weights))
+        self.total = self.cumulative_weights[-1] if self.cumulative_weights else 0
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    # Return 'k' entities picked at random by weight, as random.choices would
+    def sample(self, rng: random.Random, k: int) -> List[Entity]:
+        if not self.entities:
+            return []
+        entities, cumulative_weights, total = self.entities, self.cumulative_weights, self.total
+        last = len(entities) - 1
+        return [entities[bisect(cumulative_weights, rng.random() * total, 0, last)] for _ in range(k)]
+
+
+class SpawnTables:
+    """ The spawn tables of a game, see the module docstring. """
+    def __init__(self,
+                 max_items_by_floor: ValueTable,
+                 max_monsters_by_floor: ValueTable,
+                 item_chances: ChanceTable,
+                 enemy_chances: ChanceTable):
+        self.max_items_by_floor = sorted(max_items_by_floor)
+        self.max_monsters_by_floor = sorted(max_monsters_by_floor)
+        self.item_chances = dict(sorted(item_chances.items()))
+        self.enemy_chances = dict(sorted(enemy_chances.items()))
+        # Compiled tables, by floor number
+        self._max_items: Dict[int, int] = {}
+        self._max_monsters: Dict[int, int] = {}
+        self._items: Dict[int, SpawnTable] = {}
+        self._enemies: Dict[int, SpawnTable] = {}
+
+    # Build tables from their JSON form. Tables missing from 'data' are
+    # taken from 'defaults'.
+    @classmethod
+    def from_json(cls, data: Dict[str, Any], defaults: Optional[SpawnTables] = None) -> SpawnTables:
+        import entity_factories
+
+        tables: Dict[str, Any] = {}
+        for name, table in data.items():
+            if name not in TABLES:
+                raise ValueError(f"Unknown table {name!r}, expected one of {', '.join(TABLES)}.")
+            if name.endswith("_chances"):
+                tables[name] = {
+                    int(floor): [(getattr(entity_factories, entity), weight) for entity, weight in chances]
+                    for floor, chances in table.items()
+                }
+            else:
+                tables[name] = [(floor, value) for floor, value in table]
+        for name in TABLES:
+            if name not in tables:
+                if defaults is None:
+                    raise ValueError(f"Spawn table {name!r} is missing.")
+                tables[name] = getattr(defaults, name)
+        return cls(**tables)
+
+    @classmethod
+    def load(cls, filename: str = DEFAULT_FILENAME, defaults: Optional[SpawnTables] = None) -> SpawnTables:
+        with open(filename) as f:
+            return cls.from_json(json.load(f), defaults)
+
+    # Most items and monsters in a room on a floor
+    def max_items(self, floor: int) -> int:
+        value = self._max_items.get(floor)
+        if value is None:
+            value = self._max_items[floor] = _value_for_floor(self.max_items_by_floor, floor)
+        return value
+
+    def max_monsters(self, floor: int) -> int:
+        value = self._max_monsters.get(floor)
+        if value is None:
+            value = self._max_monsters[floor] = _value_for_floor(self.max_monsters_by_floor, floor)
+        return value
+
+    # The items and monsters which can spawn on a floor
+    def items(self, floor: int) -> SpawnTable:
+        table = self._items.get(floor)
+        if table is None:
+            table = self._items[floor] = _compile(self.item_chances, floor)
+        return table
+
+    def enemies(self, floor: int) -> SpawnTable:
+        table = self._enemies.get(floor)
+        if table is None:
+            table = self._enemies[floor] = _compile(self.enemy_chances, floor)
+        return table
+
+
+# Return the value of the last entry starting at or before 'floor', or 0
+def _value_for_floor(table: ValueTable, floor: int) -> int:
+    current_value = 0
+    for floor_minimum, value in table:
+        if floor_minimum > floor:
+            break
+        current_value = value
+    return current_value
+
+
+# Combine the weights of every entry starting at or before 'floor'
+def _compile(chances: ChanceTable, floor: int) -> SpawnTable:
+    weights: Dict[Entity, int] = {}
+    for floor_minimum, entries in chances.items():
+        if floor_minimum > floor:
+            break
+        for entity, weight in entries:
+            weights[entity] = weight
+    return SpawnTable(list(weights), list(weights.values()))
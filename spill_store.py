@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import functools
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Generic, Hashable, List, Optional, Set, Tuple, TypeVar, Union
+import weakref
+
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# A serialized value, or a function returning one
+Payload = Union[bytes, Callable[[], bytes]]
+
+
+class SpillStore(Generic[K, V]):
+    """ Keeps values by key, within a memory bound. The most recently stored
+    values stay in memory, least recently stored first out, as long as their
+    estimated size fits in 'max_bytes'. Older ones are serialized into files
+    in a temporary directory and read back when taken. The most recently
+    stored value stays in memory even if it alone is too big.
+
+    By default values are bytes, kept and spilled as they are. Stores of
+    anything else override serialize, to give a value's bytes, and
+    _value_nbytes, to estimate its size in memory.
+    """
+    # Prefix of the temporary directory's name
+    prefix = "spill-"
+    # Attributes made by _reset, which aren't pickled
+    _transient: Tuple[str, ...] = ("_in_memory", "_spilled", "_directory", "_lock", "_pins",
+                                   "_orphaned", "_file_numbers")
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        # Values written to disk to make room
+        self.spills = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self._in_memory: OrderedDict[K, V] = OrderedDict()
+        self._spilled: Dict[K, str] = {}
+        self._directory: Optional[str] = None
+        # Spill files a save still has to read, with how many times, and
+        # those to delete once it has
+        self._lock = threading.Lock()
+        self._pins: Dict[str, int] = {}
+        self._orphaned: Set[str] = set()
+        self._file_numbers = itertools.count()
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._in_memory or key in self._spilled
+
+    def __len__(self) -> int:
+        return len(self._in_memory) + len(self._spilled)
+
+    # Estimated bytes used by the values held in memory
+    @property
+    def nbytes(self) -> int:
+        return sum(self._value_nbytes(key) for key in self._in_memory)
+
+    def _value_nbytes(self, key: K) -> int:
+        return len(self._in_memory[key])  # type: ignore
+
+    # Return the serialized form of a value held in memory
+    def serialize(self, key: K) -> bytes:
+        return self._in_memory[key]  # type: ignore
+
+    # Store a value, spilling older values if needed
+    def put(self, key: K, value: V) -> None:
+        self.discard(key)
+        self._in_memory[key] = value
+        self.evict()
+
+    # Spill the least recently stored values until the rest fit in max_bytes
+    def evict(self) -> None:
+        size = self.nbytes
+        while size > self.max_bytes and len(self._in_memory) > 1:
+            key = next(iter(self._in_memory))
+            size -= self._value_nbytes(key)
+            self.put_serialized(key, self.serialize(key))
+            self.spills += 1
+
+    # Store a value already serialized straight to disk
+    def put_serialized(self, key: K, data: bytes) -> None:
+        self.discard(key)
+        # Numbered, so a file a save is still reading is never overwritten
+        filename = os.path.join(self._spill_directory(), f"{next(self._file_numbers)}.spill")
+        with open(filename, "wb") as f:
+            f.write(data)
+        self._spilled[key] = filename
+
+    # Remove a value held in memory and return it, or None if it isn't
+    def pop(self, key: K) -> Optional[V]:
+        if key not in self._in_memory:
+            return None
+        self._forget(key)
+        return self._in_memory.pop(key)
+
+    # Remove a spilled value and return its serialized form, or None if it
+    # wasn't spilled
+    def pop_spilled(self, key: K) -> Optional[bytes]:
+        filename = self._spilled.get(key)
+        if filename is None:
+            return None
+        with open(filename, "rb") as f:
+            data = f.read()
+        self.discard(key)
+        return data
+
+    def discard(self, key: K) -> None:
+        if key in self._in_memory:
+            self._forget(key)
+            del self._in_memory[key]
+        filename = self._spilled.pop(key, None)
+        if filename is None:
+            return
+        with self._lock:
+            if filename in self._pins:
+                # Removed by _read_pinned once the save has read it
+                self._orphaned.add(filename)
+                return
+        os.remove(filename)
+
+    # Drop whatever a subclass keeps about a value leaving memory
+    def _forget(self, key: K) -> None:
+        pass
+
+    # Return the payload saving a value held in memory, see snapshot
+    def _payload(self, key: K) -> Payload:
+        return self.serialize(key)
+
+    # Return every stored value as (key, payload) for the sections of a save.
+    # Spilled values aren't read here: they are given as functions for the
+    # save's writer to call, which read their files on its thread. The files
+    # are kept until then, whatever happens to the store meanwhile.
+    def snapshot(self) -> List[Tuple[K, Payload]]:
+        values = [(key, self._payload(key)) for key in self._in_memory]
+        with self._lock:
+            for key, filename in self._spilled.items():
+                self._pins[filename] = self._pins.get(filename, 0) + 1
+                values.append((key, functools.partial(self._read_pinned, filename)))
+        return values
+
+    # Read a spill file pinned by snapshot, then unpin it
+    def _read_pinned(self, filename: str) -> bytes:
+        try:
+            with open(filename, "rb") as f:
+                return f.read()
+        finally:
+            with self._lock:
+                self._pins[filename] -= 1
+                remove = False
+                if not self._pins[filename]:
+                    del self._pins[filename]
+                    remove = filename in self._orphaned
+                    self._orphaned.discard(filename)
+            if remove:
+                os.remove(filename)
+
+    # The directory is removed when this store is garbage collected or the
+    # program exits
+    def _spill_directory(self) -> str:
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix=self.prefix)
+            weakref.finalize(self, shutil.rmtree, self._directory, ignore_errors=True)
+        return self._directory
+
+    # The values are saved by savefile in their own sections, only the
+    # settings and counters are pickled
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        for name in self._transient:
+            del state[name]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._reset()
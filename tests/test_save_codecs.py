@@ -0,0 +1,22 @@
+import pytest
+
+import save_codecs
+
+
+def test_raw_codec_rejects_a_level():
+    with pytest.raises(ValueError, match="raw codec takes no level"):
+        save_codecs.get_codec("raw:1")
+    with pytest.raises(ValueError, match="raw codec takes no level"):
+        save_codecs.get_codec("none:0")
+
+
+def test_level_out_of_range():
+    with pytest.raises(ValueError, match="expected 0-9"):
+        save_codecs.get_codec("zlib:10")
+
+
+def test_specs_round_trip():
+    for spec in ("raw", "zlib", "zlib:1", "lzma", "lzma:0"):
+        codec = save_codecs.get_codec(spec)
+        assert codec.spec == spec
+        assert codec.decompress(codec.compress(b"data" * 100)) == b"data" * 100
@@ -11,6 +11,17 @@ graphic_dt = np.dtype(
     ]
 )
 
+# Same fields laid out like Console.tiles_rgb, padded to 12 bytes per tile, so
+# arrays of it can be copied into a console as raw bytes
+console_graphic_dt = np.dtype(
+    {
+        "names": ["ch", "fg", "bg"],
+        "formats": [np.int32, "3B", "3B"],
+        "offsets": [0, 4, 8],
+        "itemsize": 12,
+    }
+)
+
 # Tile struct used for statically defined tile data
 tile_dt = np.dtype(
     [
@@ -46,6 +57,11 @@ wall = new_tile(
     light=(ord(" "), (255, 255, 255), (130, 110, 50)),
 )
 
+up_stairs = new_tile(walkable = True, 
+                     transparent = True, 
+                     dark = (ord("<"), (0, 0, 100), (50, 50, 150)), 
+                     light = (ord("<"), (255, 255, 255), (200, 180, 50)))
+
 down_stairs = new_tile(walkable = True, 
                        transparent = True, 
                        dark = (ord(">"), (0, 0, 100), (50, 50, 150)), 